@@ -0,0 +1,162 @@
+from app import db
+from models import Portfolio, Transaction
+
+
+class PositionError(ValueError):
+    """Raised when a transaction cannot be applied to a position"""
+
+
+def apply_transaction(portfolio, transaction_type, quantity, price):
+    """
+    Apply one BUY or SELL to a position in constant time
+    Uses the average cost method: a BUY blends its price into the average,
+    a SELL reduces the quantity and leaves the average unchanged. Returns
+    the position's remaining quantity.
+    """
+    current_quantity = portfolio.quantity or 0
+    average_price = portfolio.average_buy_price or 0
+
+    if transaction_type == 'BUY':
+        cost_basis = current_quantity * average_price + quantity * price
+        portfolio.quantity = current_quantity + quantity
+        portfolio.average_buy_price = cost_basis / portfolio.quantity
+    elif transaction_type == 'SELL':
+        if quantity > current_quantity:
+            raise PositionError('You cannot sell more shares than you own')
+        portfolio.quantity = current_quantity - quantity
+    else:
+        raise PositionError(f'Unknown transaction type: {transaction_type}')
+
+    return portfolio.quantity
+
+
+def record_trade(user_id, stock_id, transaction_type, quantity, price, timestamp=None):
+    """
+    Record a transaction and update the matching position in the session
+    Creates the position on the first BUY and deletes it once it is sold
+    out. The caller is responsible for committing. Returns the transaction.
+    """
+    portfolio = Portfolio.query.filter_by(user_id=user_id, stock_id=stock_id).first()
+    if portfolio is None:
+        if transaction_type == 'SELL':
+            raise PositionError('You cannot sell more shares than you own')
+        portfolio = Portfolio(user_id=user_id, stock_id=stock_id, quantity=0, average_buy_price=0)
+        db.session.add(portfolio)
+
+    remaining = apply_transaction(portfolio, transaction_type, quantity, price)
+
+    transaction = Transaction(
+        user_id=user_id,
+        stock_id=stock_id,
+        transaction_type=transaction_type,
+        quantity=quantity,
+        price=price
+    )
+    if timestamp is not None:
+        transaction.timestamp = timestamp
+    db.session.add(transaction)
+
+    # If sold all shares, remove from portfolio
+    if remaining <= 0:
+        db.session.delete(portfolio)
+
+    return transaction
+
+
+def replay_transactions(transactions):
+    """
+    Replay (transaction_type, quantity, price) tuples in order
+    Returns the resulting (quantity, average_buy_price). A position that is
+    sold out starts over with a fresh average on the next BUY, matching what
+    record_trade does incrementally. Oversells are clamped to zero.
+    """
+    position = Portfolio(quantity=0, average_buy_price=0)
+    for transaction_type, quantity, price in transactions:
+        if transaction_type == 'SELL':
+            quantity = min(quantity, position.quantity)
+        apply_transaction(position, transaction_type, quantity, price)
+        if position.quantity <= 0:
+            position.quantity = 0
+            position.average_buy_price = 0
+    return position.quantity, position.average_buy_price
+
+
+def rebuild_position(user_id, stock_id):
+    """
+    Recompute a position from the full transaction log
+    Only needed for repairs; normal trades go through record_trade. Returns
+    the rebuilt position, or None if nothing is held. Does not commit.
+    """
+    transactions = db.session.query(
+        Transaction.transaction_type, Transaction.quantity, Transaction.price
+    ).filter_by(user_id=user_id, stock_id=stock_id).order_by(
+        Transaction.timestamp, Transaction.id
+    ).all()
+    quantity, average_price = replay_transactions(transactions)
+
+    portfolio = Portfolio.query.filter_by(user_id=user_id, stock_id=stock_id).first()
+    if quantity <= 0:
+        if portfolio is not None:
+            db.session.delete(portfolio)
+        return None
+
+    if portfolio is None:
+        portfolio = Portfolio(user_id=user_id, stock_id=stock_id)
+        db.session.add(portfolio)
+    portfolio.quantity = quantity
+    portfolio.average_buy_price = average_price
+    return portfolio
+
+
+def rebuild_positions(user_id=None):
+    """Rebuild every position (optionally for one user) from the transaction log; returns the count"""
+    pairs = db.session.query(Transaction.user_id, Transaction.stock_id).distinct()
+    held = db.session.query(Portfolio.user_id, Portfolio.stock_id)
+    if user_id is not None:
+        pairs = pairs.filter(Transaction.user_id == user_id)
+        held = held.filter(Portfolio.user_id == user_id)
+
+    # Include positions without any transactions so stray rows get removed
+    keys = set(pairs.all()) | set(held.all())
+    for key_user_id, stock_id in sorted(keys):
+        rebuild_position(key_user_id, stock_id)
+    return len(keys)
+
+
+def rebuild_user_positions(user_id, stock_ids):
+    """
+    Rebuild one user's positions in the given stocks with two queries
+    Used after bulk imports, where calling rebuild_position per stock would
+    cost two queries each. Returns the number of positions still held.
+    Does not commit.
+    """
+    stock_ids = set(stock_ids)
+    transactions = {stock_id: [] for stock_id in stock_ids}
+    rows = db.session.query(
+        Transaction.stock_id, Transaction.transaction_type, Transaction.quantity, Transaction.price
+    ).filter(Transaction.user_id == user_id).order_by(Transaction.timestamp, Transaction.id)
+    for stock_id, transaction_type, quantity, price in rows:
+        if stock_id in stock_ids:
+            transactions[stock_id].append((transaction_type, quantity, price))
+
+    portfolios = {
+        portfolio.stock_id: portfolio
+        for portfolio in Portfolio.query.filter_by(user_id=user_id)
+        if portfolio.stock_id in stock_ids
+    }
+
+    held = 0
+    for stock_id, stock_transactions in transactions.items():
+        quantity, average_price = replay_transactions(stock_transactions)
+        portfolio = portfolios.get(stock_id)
+        if quantity <= 0:
+            if portfolio is not None:
+                db.session.delete(portfolio)
+            continue
+        if portfolio is None:
+            portfolio = Portfolio(user_id=user_id, stock_id=stock_id)
+            db.session.add(portfolio)
+        portfolio.quantity = quantity
+        portfolio.average_buy_price = average_price
+        held += 1
+    return held
@@ -0,0 +1,127 @@
+from collections import namedtuple
+
+import numpy as np
+
+from app import db
+from models import Stock, Portfolio
+
+# Colors used for allocation chart slices, repeating after the last one
+CHART_COLORS = [
+    '#4dc9f6', '#f67019', '#f53794', '#537bc4', '#acc236',
+    '#166a8f', '#00a950', '#58595b', '#8549ba', '#8b0000',
+    '#3cb44b', '#ffe119', '#4363d8', '#f58231', '#911eb4'
+]
+
+# One rendered holding row; mirrors the Portfolio properties used by templates
+PositionRow = namedtuple('PositionRow', [
+    'user_id', 'stock_id', 'symbol', 'company_name', 'quantity', 'average_buy_price',
+    'current_price', 'current_value', 'initial_investment', 'profit_loss',
+    'profit_loss_percentage', 'weight'
+])
+
+
+class PortfolioFrame:
+    """Columnar snapshot of portfolio positions with vectorized metrics
+
+    Positions are loaded with a single column query (no ORM objects) into
+    NumPy arrays, and value, cost basis, P/L, P/L %, weights and allocation
+    breakdowns are computed on whole arrays. Missing prices and average
+    prices count as zero, matching the Portfolio model properties.
+    """
+
+    def __init__(self, user_ids, stock_ids, symbols, company_names, quantities,
+                 average_buy_prices, current_prices):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.stock_ids = np.asarray(stock_ids, dtype=np.int64)
+        self.symbols = list(symbols)
+        self.company_names = list(company_names)
+        self.quantities = np.asarray(quantities, dtype=np.float64)
+        self.average_buy_prices = np.nan_to_num(np.asarray(average_buy_prices, dtype=np.float64))
+        self.current_prices = np.nan_to_num(np.asarray(current_prices, dtype=np.float64))
+
+        self.current_values = self.quantities * self.current_prices
+        self.initial_investments = self.quantities * self.average_buy_prices
+        # P/L only counts when both prices are known, like Portfolio.profit_loss
+        known = (self.current_prices != 0) & (self.average_buy_prices != 0)
+        self.profit_losses = np.where(known, self.current_values - self.initial_investments, 0.0)
+        self.profit_loss_percentages = np.divide(
+            self.profit_losses * 100, self.initial_investments,
+            out=np.zeros_like(self.profit_losses), where=self.initial_investments > 0
+        )
+
+    @classmethod
+    def load(cls, user_id=None, user_ids=None):
+        """Load one user's positions, several users' (user_ids), or every user's"""
+        query = db.session.query(
+            Portfolio.user_id, Portfolio.stock_id, Stock.symbol, Stock.company_name,
+            Portfolio.quantity, Portfolio.average_buy_price, Stock.current_price
+        ).join(Stock, Portfolio.stock_id == Stock.id)
+        if user_id is not None:
+            query = query.filter(Portfolio.user_id == user_id)
+        elif user_ids is not None:
+            query = query.filter(Portfolio.user_id.in_(list(user_ids)))
+        rows = query.order_by(Portfolio.user_id, Portfolio.id).all()
+
+        if not rows:
+            return cls([], [], [], [], [], [], [])
+        columns = list(zip(*rows))
+        # None becomes NaN in float arrays and is zeroed in __init__
+        return cls(*columns[:4], *(
+            [np.nan if value is None else value for value in column] for column in columns[4:]
+        ))
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def for_user(self, user_id):
+        """Return a new frame with only the given user's positions"""
+        index = np.flatnonzero(self.user_ids == user_id).tolist()
+        return PortfolioFrame(
+            self.user_ids[index], self.stock_ids[index],
+            [self.symbols[i] for i in index], [self.company_names[i] for i in index],
+            self.quantities[index], self.average_buy_prices[index], self.current_prices[index]
+        )
+
+    @property
+    def weights(self):
+        """Share of total current value held in each position"""
+        total = self.current_values.sum()
+        if total <= 0:
+            return np.zeros_like(self.current_values)
+        return self.current_values / total
+
+    def totals(self):
+        """Totals in the same shape as utils.calculate_portfolio_totals"""
+        total_current_value = float(self.current_values.sum())
+        total_investment = float(self.initial_investments.sum())
+        total_profit_loss = total_current_value - total_investment
+        if total_investment > 0:
+            profit_loss_percentage = total_profit_loss / total_investment * 100
+        else:
+            profit_loss_percentage = 0.0
+
+        return {
+            'total_current_value': total_current_value,
+            'total_investment': total_investment,
+            'total_profit_loss': total_profit_loss,
+            'profit_loss_percentage': profit_loss_percentage
+        }
+
+    def allocation(self, colors=CHART_COLORS):
+        """Chart data (labels, values, colors) for positions with a quantity and a price"""
+        positions = np.flatnonzero((self.quantities > 0) & (self.current_prices > 0))
+        return {
+            'labels': [self.symbols[i] for i in positions.tolist()],
+            'values': self.current_values[positions].tolist(),
+            'colors': [colors[i % len(colors)] for i in positions.tolist()]
+        }
+
+    def rows(self):
+        """Holding rows for templates, in load order"""
+        columns = zip(
+            self.user_ids.tolist(), self.stock_ids.tolist(), self.symbols, self.company_names,
+            self.quantities.tolist(), self.average_buy_prices.tolist(), self.current_prices.tolist(),
+            self.current_values.tolist(), self.initial_investments.tolist(), self.profit_losses.tolist(),
+            self.profit_loss_percentages.tolist(), self.weights.tolist()
+        )
+        return [PositionRow(*column) for column in columns]
@@ -1,5 +1,5 @@
 import os
-import logging
+import threading
 from datetime import datetime
 
 from flask import Flask
@@ -7,51 +7,165 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from flask_login import LoginManager
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
-
 class Base(DeclarativeBase):
     pass
 
-# Initialize SQLAlchemy with custom base
+# Extensions are created unbound and attached to an app in create_app
 db = SQLAlchemy(model_class=Base)
 
-# Create Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "fallback_secret_key_for_development")
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+login_manager.login_message_category = 'info'
 
-# Add datetime utility to Jinja templates
-app.jinja_env.globals.update(now=datetime.now)
+@login_manager.user_loader
+def load_user(user_id):
+    from models import User
+    return User.query.get(int(user_id))
 
-# Database configuration
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///portfolio.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
-# Initialize the database
-db.init_app(app)
+def load_config(app):
+    """Read settings from the environment into the app config"""
+    app.secret_key = os.environ.get("SESSION_SECRET", "fallback_secret_key_for_development")
 
-# Setup Flask-Login
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-login_manager.login_message_category = 'info'
+    # Database configuration
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///portfolio.db")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+    }
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+    # Background price refresh configuration
+    app.config["PRICE_REFRESH_ENABLED"] = os.environ.get("PRICE_REFRESH_ENABLED", "1") == "1"
+    app.config["PRICE_REFRESH_INTERVAL"] = int(os.environ.get("PRICE_REFRESH_INTERVAL", 900))
+
+    # Quote provider configuration ("yahoo" or the offline "local" provider)
+    app.config["QUOTE_PROVIDER"] = os.environ.get("QUOTE_PROVIDER", "yahoo")
+    app.config["QUOTE_REPLAY_FILE"] = os.environ.get("QUOTE_REPLAY_FILE")
+    app.config["QUOTE_PROVIDER_SEED"] = int(os.environ.get("QUOTE_PROVIDER_SEED", 0))
+    app.config["QUOTE_PROVIDER_LATENCY"] = float(os.environ.get("QUOTE_PROVIDER_LATENCY", 0))
+
+    # In-process quote cache used by get_stock_info and /search_stock
+    app.config["QUOTE_CACHE_SIZE"] = int(os.environ.get("QUOTE_CACHE_SIZE", 1024))
+    app.config["QUOTE_CACHE_TTL"] = float(os.environ.get("QUOTE_CACHE_TTL", 60))
+
+    # Optional SQLite file shared by all worker processes as a quote cache
+    app.config["QUOTE_SHARED_CACHE_PATH"] = os.environ.get("QUOTE_SHARED_CACHE_PATH")
 
-with app.app_context():
-    # Import models here to avoid circular imports
+    # Ticker and company name list used for symbol autocomplete
+    app.config["SYMBOL_DIRECTORY_FILE"] = os.environ.get(
+        "SYMBOL_DIRECTORY_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "symbols.csv")
+    )
+
+    # Live price stream over Server-Sent Events. Each open page holds a connection,
+    # so only enable it under an async worker (gunicorn -k gevent); pages poll otherwise
+    app.config["PRICE_STREAM_ENABLED"] = os.environ.get("PRICE_STREAM_ENABLED", "0") == "1"
+    # Seconds before a stream response ends and the browser reconnects
+    app.config["PRICE_STREAM_MAX_DURATION"] = float(os.environ.get("PRICE_STREAM_MAX_DURATION", 300))
+
+    # Seconds between polls for prices written by other worker processes (0 disables)
+    app.config["PRICE_STREAM_POLL_INTERVAL"] = float(os.environ.get("PRICE_STREAM_POLL_INTERVAL", 0))
+
+    # Prometheus metrics on /metrics, optionally behind a bearer token
+    app.config["METRICS_ENABLED"] = os.environ.get("METRICS_ENABLED", "1") == "1"
+    app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+
+    # Logging: root level, per-module overrides ("providers=DEBUG,werkzeug=WARNING") and json or text output
+    app.config["LOG_LEVEL"] = os.environ.get("LOG_LEVEL", "INFO")
+    app.config["LOG_LEVELS"] = os.environ.get("LOG_LEVELS", "")
+    app.config["LOG_FORMAT"] = os.environ.get("LOG_FORMAT", "json")
+
+    # Admin request profiling (?profile=1), plus automatic capture of requests slower than the threshold (seconds, 0 disables)
+    app.config["PROFILING_ENABLED"] = os.environ.get("PROFILING_ENABLED", "1") == "1"
+    app.config["PROFILE_SLOW_REQUEST_THRESHOLD"] = float(os.environ.get("PROFILE_SLOW_REQUEST_THRESHOLD", 0))
+    if os.environ.get("PROFILE_DIR"):
+        app.config["PROFILE_DIR"] = os.environ["PROFILE_DIR"]
+
+
+def init_db():
+    """Create missing tables and indexes; needs an app context"""
     import models
-    from models import User
-    
-    # Create all database tables
+
     db.create_all()
-    
-    # User loader for Flask-Login
-    @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(int(user_id))
-
-# Import routes after app initialization to avoid circular imports
-from routes import *
+    # create_all skips existing tables, so add indexes declared since they were created
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
+def create_app(config=None):
+    """
+    Build and configure the application
+    Settings come from the environment, then from the optional config dict.
+    The schema is not touched here; run `flask init-db` to create or
+    upgrade it. Background workers start with the first request, so CLI
+    commands and pre-fork masters never run them.
+    """
+    app = Flask(__name__)
+    load_config(app)
+    if config:
+        app.config.update(config)
+
+    # Queue-backed structured logging, configured before anything logs
+    import log_config
+    log_config.init_app(app)
+
+    # Add datetime utility to Jinja templates
+    app.jinja_env.globals.update(now=datetime.now)
+
+    db.init_app(app)
+    login_manager.init_app(app)
+
+    # Request, SQL and quote fetch instrumentation
+    import metrics
+    metrics.init_app(app)
+
+    # Opt-in per-request profiling for admins and slow requests
+    import profiling
+    profiling.init_app(app)
+
+    # Import models so every table is registered on the metadata
+    import models
+
+    # Select the quote provider used for all price lookups
+    import providers
+    import quote_cache
+    import shared_cache
+    providers.init_app(app)
+    quote_cache.init_app(app)
+    shared_cache.init_app(app)
+
+    # Push committed price changes to live price streams
+    import price_stream
+    price_stream.init_app(app)
+
+    # Symbol autocomplete index, built in the background with the workers below
+    import symbols
+    symbols.init_app(app)
+
+    from routes import bp
+    app.register_blueprint(bp)
+
+    # Register maintenance commands
+    from commands import register_commands
+    register_commands(app)
+
+    # Background price refresh scheduler, started with the workers below
+    from scheduler import PriceRefreshScheduler
+    PriceRefreshScheduler(app)
+
+    start_lock = threading.Lock()
+    started = threading.Event()
+
+    @app.before_request
+    def start_background_workers():
+        if started.is_set():
+            return
+        with start_lock:
+            if not started.is_set():
+                app.extensions['price_refresh_scheduler'].start()
+                price_stream.start_watcher(app)
+                symbols.start_loader(app)
+                started.set()
+
+    return app
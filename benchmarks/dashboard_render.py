@@ -0,0 +1,175 @@
+"""
+Dashboard render benchmark: request time under different logging setups
+
+Each setup runs in a fresh process against a seeded SQLite database with
+one user holding --positions stocks. It times GET /dashboard and a direct
+get_portfolio_data_for_chart call, with log output written to a file so
+the terminal does not skew the numbers. The setups are:
+
+    debug-sync   root logger at DEBUG with a synchronous stream handler,
+                 the way the app used to be configured
+    debug-queue  DEBUG records routed through the queue handler
+    production   LOG_LEVEL=INFO through the queue handler (the default)
+
+    python benchmarks/dashboard_render.py --positions 500 --requests 200 --output dashboard.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETUPS = ('debug-sync', 'debug-queue', 'production')
+
+WORKER_SCRIPT = """
+import json, logging, sys, time
+from datetime import datetime
+
+setup, positions, requests = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+
+from app import create_app, db, init_db
+import log_config
+
+app = create_app({
+    'PRICE_REFRESH_ENABLED': False,
+    'LOG_LEVEL': 'INFO' if setup == 'production' else 'DEBUG',
+    'LOG_LEVELS': {},
+})
+if setup == 'debug-sync':
+    log_config.stop_logging()
+    logging.basicConfig(level=logging.DEBUG, stream=sys.stderr, force=True)
+
+from sqlalchemy import insert
+from models import User, Stock, Portfolio, Transaction
+from snapshots import refresh_snapshot
+from utils import get_portfolio_data_for_chart, get_portfolio_positions
+
+with app.app_context():
+    init_db()
+    user = User(username='bench', email='bench@example.com', is_admin=False)
+    user.set_password('benchmark')
+    db.session.add(user)
+    db.session.flush()
+    now = datetime.utcnow()
+    db.session.execute(insert(Stock), [
+        {'symbol': f'S{i:05d}', 'company_name': f'Stock {i}', 'current_price': 10.0 + i % 90, 'last_updated': now}
+        for i in range(positions)
+    ])
+    stock_ids = [row[0] for row in db.session.query(Stock.id).order_by(Stock.id)]
+    db.session.execute(insert(Portfolio), [
+        {'user_id': user.id, 'stock_id': stock_id, 'quantity': 5.0, 'average_buy_price': 20.0}
+        for stock_id in stock_ids
+    ])
+    db.session.execute(insert(Transaction), [
+        {'user_id': user.id, 'stock_id': stock_id, 'transaction_type': 'BUY',
+         'quantity': 5.0, 'price': 20.0, 'timestamp': now}
+        for stock_id in stock_ids
+    ])
+    refresh_snapshot(user.id)
+    db.session.commit()
+    user_id = user.id
+
+client = app.test_client()
+with client.session_transaction() as session:
+    session['_user_id'] = str(user_id)
+client.get('/dashboard')
+
+records = []
+class Counter(logging.Handler):
+    def emit(self, record):
+        records.append(record.name)
+logging.getLogger().addHandler(Counter())
+
+dashboard = []
+for _ in range(requests):
+    started = time.perf_counter()
+    response = client.get('/dashboard')
+    dashboard.append(time.perf_counter() - started)
+    assert response.status_code == 200, response.status_code
+dashboard_records = len(records)
+
+chart = []
+with app.app_context():
+    rows = get_portfolio_positions(user_id)
+    for _ in range(requests):
+        started = time.perf_counter()
+        get_portfolio_data_for_chart(user_id, rows)
+        chart.append(time.perf_counter() - started)
+
+log_config.stop_logging()
+print(json.dumps({
+    'dashboard': dashboard,
+    'chart_data': chart,
+    'records_per_dashboard': dashboard_records / requests,
+    'records_per_chart_data': (len(records) - dashboard_records) / requests,
+}))
+"""
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(values):
+    return {
+        'median': statistics.median(values),
+        'p95': percentile(values, 0.95),
+        'max': max(values),
+    }
+
+
+def run_setup(setup, positions, requests):
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'dashboard.db')
+    env['QUOTE_PROVIDER'] = 'local'
+    env['PYTHONPATH'] = ROOT
+    log_path = os.path.join(workdir, 'app.log')
+    with open(log_path, 'w') as log_file:
+        output = subprocess.run(
+            [sys.executable, '-c', WORKER_SCRIPT, setup, str(positions), str(requests)],
+            cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=log_file, text=True, check=True
+        ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['log_bytes'] = os.path.getsize(log_path)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--positions', type=int, default=500, help='Positions held by the benchmark user')
+    parser.add_argument('--requests', type=int, default=100, help='Dashboard renders to time per setup')
+    parser.add_argument('--setup', choices=SETUPS, action='append', help='Run only these setups')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    results = {'positions': args.positions, 'requests': args.requests, 'setups': {}}
+    for setup in args.setup or SETUPS:
+        run = run_setup(setup, args.positions, args.requests)
+        results['setups'][setup] = {
+            'dashboard': summarize(run['dashboard']),
+            'chart_data': summarize(run['chart_data']),
+            'records_per_dashboard': run['records_per_dashboard'],
+            'records_per_chart_data': run['records_per_chart_data'],
+            'log_bytes': run['log_bytes'],
+        }
+
+    for setup, stats in results['setups'].items():
+        print(f"{setup:>12}: dashboard median {stats['dashboard']['median'] * 1000:.2f} ms "
+              f"(p95 {stats['dashboard']['p95'] * 1000:.2f}), "
+              f"chart data median {stats['chart_data']['median'] * 1000:.2f} ms, "
+              f"{stats['records_per_dashboard'] + stats['records_per_chart_data']:.0f} records, "
+              f"{stats['log_bytes']} log bytes")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+"""
+Load test: latency, throughput and SQL statements per request for the main routes
+
+A server process seeds a fresh SQLite database with --users users, each
+holding --positions of --stocks stocks built from --transactions BUY
+transactions, then serves the app on a local port with quotes from the
+offline local provider. Concurrent client threads in this process log in as
+the seeded users and send --requests requests spread over /dashboard,
+/portfolio, /transactions, /search_stock, /add_stock and
+/record_transaction. The report gives p50/p95/p99 latency, requests/s and
+SQL statements per request for each route, and can be saved as JSON and
+compared against an earlier run.
+
+    python benchmarks/load_test.py --users 50 --clients 8 --requests 4000 --output run.json
+    python benchmarks/load_test.py --baseline run.json --tolerance 0.25
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PASSWORD = 'load-test-password'
+
+# Relative weight of each route in the request mix
+ROUTE_WEIGHTS = {
+    'dashboard': 30,
+    'portfolio': 20,
+    'transactions': 20,
+    'search_stock': 15,
+    'add_stock': 5,
+    'record_transaction': 10,
+}
+
+
+def seed_database(app, users, stocks, positions, transactions, seed):
+    """Fill an empty database with users, stocks, positions, transactions and snapshots"""
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import insert
+
+    from app import db, init_db
+    from models import User, Stock, Portfolio, Transaction
+    from providers import get_provider
+    from snapshots import refresh_snapshots
+
+    rng = random.Random(seed)
+    positions = min(positions, stocks)
+    now = datetime.utcnow()
+
+    with app.app_context():
+        init_db()
+        # Hashing is deliberately slow, so every user shares one hash
+        password_user = User()
+        password_user.set_password(PASSWORD)
+
+        provider = get_provider()
+        symbols = [f"L{i:05d}" for i in range(stocks)]
+        db.session.execute(insert(Stock), [
+            {'symbol': symbol, 'company_name': f"{symbol} Corp.",
+             'current_price': provider.get_quote(symbol)['current_price'], 'last_updated': now}
+            for symbol in symbols
+        ])
+        db.session.execute(insert(User), [
+            {'username': f"user{i}", 'email': f"user{i}@example.com",
+             'password_hash': password_user.password_hash, 'is_admin': False, 'date_created': now}
+            for i in range(users)
+        ])
+        stock_ids = [row[0] for row in db.session.query(Stock.id).order_by(Stock.id)]
+        user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id)]
+
+        position_rows = []
+        transaction_rows = []
+        for user_id in user_ids:
+            held = rng.sample(stock_ids, positions) if positions else []
+            totals = {}
+            for i in range(transactions if held else 0):
+                stock_id = held[i % len(held)]
+                quantity = float(rng.randint(1, 50))
+                price = round(rng.uniform(5, 500), 2)
+                transaction_rows.append({
+                    'user_id': user_id, 'stock_id': stock_id, 'transaction_type': 'BUY',
+                    'quantity': quantity, 'price': price,
+                    'timestamp': now - timedelta(minutes=rng.randint(1, 2 * 365 * 24 * 60)),
+                })
+                quantity_total, cost_total = totals.get(stock_id, (0.0, 0.0))
+                totals[stock_id] = (quantity_total + quantity, cost_total + quantity * price)
+            position_rows.extend(
+                {'user_id': user_id, 'stock_id': stock_id, 'quantity': quantity,
+                 'average_buy_price': cost / quantity}
+                for stock_id, (quantity, cost) in totals.items()
+            )
+        if position_rows:
+            db.session.execute(insert(Portfolio), position_rows)
+        for start in range(0, len(transaction_rows), 10000):
+            db.session.execute(insert(Transaction), transaction_rows[start:start + 10000])
+        refresh_snapshots(user_ids)
+        db.session.commit()
+
+    return [f"user{i}" for i in range(users)], symbols
+
+
+def serve(args):
+    """Seed the database, then serve the app and print the port and seeded names as JSON"""
+    sys.path.insert(0, ROOT)
+    from flask import g
+    from werkzeug.serving import make_server
+
+    from app import create_app
+
+    app = create_app({
+        'PRICE_REFRESH_ENABLED': False,
+        'QUOTE_PROVIDER': 'local',
+        'QUOTE_PROVIDER_LATENCY': args.quote_latency,
+        'METRICS_ENABLED': True,
+        'WTF_CSRF_ENABLED': False,
+        'LOG_LEVEL': 'WARNING',
+    })
+
+    @app.after_request
+    def report_query_count(response):
+        # Registered after metrics.init_app, so it runs before the count is popped
+        response.headers['X-Query-Count'] = str(g.get('metrics_queries', 0))
+        return response
+
+    started = time.perf_counter()
+    usernames, symbols = seed_database(
+        app, args.users, args.stocks, args.positions, args.transactions, args.seed
+    )
+    seeded = time.perf_counter() - started
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    print(json.dumps({
+        'port': server.server_port, 'usernames': usernames, 'symbols': symbols, 'seed_seconds': seeded,
+    }), flush=True)
+    server.serve_forever()
+
+
+class Client:
+    """One logged-in user session against the test server"""
+
+    def __init__(self, port, username):
+        self.port = port
+        self.cookies = {}
+        status, _, _ = self.request('POST', '/login', {'username': username, 'password': PASSWORD})
+        if status != 302 or 'session' not in self.cookies:
+            raise RuntimeError(f"Login as {username} failed with status {status}")
+
+    def request(self, method, path, form=None):
+        """Send one request; returns (status, seconds, SQL statement count)"""
+        headers = {'Cookie': '; '.join(f"{name}={value}" for name, value in self.cookies.items())}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.read()
+        finally:
+            connection.close()
+        elapsed = time.perf_counter() - started
+
+        for header in response.headers.get_all('Set-Cookie') or []:
+            name, _, value = header.split(';', 1)[0].partition('=')
+            self.cookies[name.strip()] = value
+        return response.status, elapsed, int(response.headers.get('X-Query-Count', 0))
+
+
+def route_request(route, rng, symbols):
+    """Return (method, path, form) for one request to a route"""
+    symbol = rng.choice(symbols)
+    if route == 'search_stock':
+        return 'GET', f"/search_stock?symbol={symbol}", None
+    if route == 'add_stock':
+        return 'POST', '/add_stock', {'symbol': symbol, 'quantity': 1, 'price': round(rng.uniform(5, 500), 2)}
+    if route == 'record_transaction':
+        return 'POST', '/record_transaction', {
+            'symbol': symbol, 'transaction_type': 'BUY', 'quantity': 1, 'price': round(rng.uniform(5, 500), 2),
+        }
+    return 'GET', f"/{route}", None
+
+
+def run_clients(port, usernames, symbols, clients, requests, seed):
+    """Send requests from concurrent clients; returns (samples by route, wall seconds)"""
+    routes = list(ROUTE_WEIGHTS)
+    weights = [ROUTE_WEIGHTS[route] for route in routes]
+    samples = {route: [] for route in routes}
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients + 1)
+    per_client = [requests // clients + (1 if i < requests % clients else 0) for i in range(clients)]
+
+    def work(index):
+        rng = random.Random(seed + index)
+        try:
+            client = Client(port, usernames[index % len(usernames)])
+        except Exception:
+            # Release the other clients instead of leaving them at the barrier
+            barrier.abort()
+            raise
+        plan = rng.choices(routes, weights, k=per_client[index])
+        results = []
+        barrier.wait()
+        for route in plan:
+            method, path, form = route_request(route, rng, symbols)
+            results.append((route,) + client.request(method, path, form))
+        with lock:
+            for route, status, seconds, queries in results:
+                samples[route].append((status, seconds, queries))
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        raise SystemExit("A client could not log in")
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(samples, wall):
+    """Latency percentiles, throughput, errors and SQL statements for a list of samples"""
+    if not samples:
+        return None
+    latencies = [seconds for _, seconds, _ in samples]
+    queries = [count for _, _, count in samples]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for status, _, _ in samples if status >= 400),
+        'rps': len(samples) / wall,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'mean': statistics.fmean(latencies),
+        'max': max(latencies),
+        'queries_mean': statistics.fmean(queries),
+        'queries_max': max(queries),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return messages for routes whose p95 or mean queries grew by more than tolerance"""
+    regressions = []
+    for route, stats in results['routes'].items():
+        before = baseline.get('routes', {}).get(route)
+        if not stats or not before:
+            continue
+        for key in ('p95', 'queries_mean'):
+            if before[key] and stats[key] > before[key] * (1 + tolerance):
+                regressions.append(f"{route} {key}: {before[key]:.4g} -> {stats[key]:.4g}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=20, help='Seeded users')
+    parser.add_argument('--stocks', type=int, default=500, help='Seeded stocks')
+    parser.add_argument('--positions', type=int, default=50, help='Positions per user')
+    parser.add_argument('--transactions', type=int, default=200, help='Transactions per user')
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent client threads')
+    parser.add_argument('--requests', type=int, default=2000, help='Total requests across all clients')
+    parser.add_argument('--quote-latency', type=float, default=0.0, help='Simulated quote provider latency in seconds')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for data and request mix')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare against results saved by an earlier --output')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed fractional growth in p95 latency and queries before failing')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'load.db')
+    env['PYTHONPATH'] = ROOT
+    server_args = [
+        '--serve', '--users', str(args.users), '--stocks', str(args.stocks),
+        '--positions', str(args.positions), '--transactions', str(args.transactions),
+        '--quote-latency', str(args.quote_latency), '--seed', str(args.seed),
+    ]
+    with open(os.path.join(workdir, 'server.log'), 'w') as log_file:
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)] + server_args,
+            cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=log_file, text=True
+        )
+    try:
+        line = server.stdout.readline()
+        if not line:
+            raise SystemExit(f"Server failed to start, see {os.path.join(workdir, 'server.log')}")
+        ready = json.loads(line)
+        print(f"Seeded {args.users} users, {args.stocks} stocks in {ready['seed_seconds']:.1f}s; "
+              f"sending {args.requests} requests from {args.clients} clients")
+        samples, wall = run_clients(
+            ready['port'], ready['usernames'], ready['symbols'], args.clients, args.requests, args.seed
+        )
+    finally:
+        server.terminate()
+        server.wait()
+
+    results = {
+        'parameters': {key: value for key, value in vars(args).items()
+                       if key not in ('output', 'baseline', 'tolerance', 'serve')},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform()},
+        'wall_seconds': wall,
+        'total': summarize([sample for route in samples.values() for sample in route], wall),
+        'routes': {route: summarize(route_samples, wall) for route, route_samples in samples.items()},
+    }
+
+    print(f"{'route':>20} {'requests':>8} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'queries':>8}")
+    for route, stats in list(results['routes'].items()) + [('total', results['total'])]:
+        if stats:
+            print(f"{route:>20} {stats['requests']:>8} {stats['errors']:>6} {stats['rps']:>8.1f} "
+                  f"{stats['p50'] * 1000:>8.1f} {stats['p95'] * 1000:>8.1f} {stats['p99'] * 1000:>8.1f} "
+                  f"{stats['queries_mean']:>8.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('parameters') != results['parameters']:
+            print("Warning: baseline was run with different parameters")
+        regressions = compare(results, baseline, args.tolerance)
+        for message in regressions:
+            print(f"Regression: {message}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+Micro-benchmarks for the portfolio math and price refresh helpers in utils
+
+For each size (10, 1k and 100k by default) the database is reseeded with one
+user holding that many positions, and one extra position with that many
+transactions. Each case is timed over --repeat runs, then run once more
+under tracemalloc for its peak and retained Python allocations. The growth
+exponent between consecutive sizes shows which functions scale worse than
+linearly (about 1.0 is linear, about 0 is constant).
+
+    calculate_portfolio_totals       SQL aggregate for the user
+    calculate_portfolio_totals_rows  sum over already loaded positions
+    get_portfolio_data_for_chart     positions loaded and turned into chart data
+    update_average_buy_price         rebuild of the position with N transactions
+    update_stock_data                refresh of N stale stocks from the local provider
+
+    python benchmarks/portfolio_utils.py --sizes 10 1000 100000 --repeat 5 --output utils.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_SIZES = (10, 1000, 100000)
+
+# Growth exponents above this are reported as superlinear
+SUPERLINEAR_EXPONENT = 1.2
+
+# The throwaway SQLite file main() creates; seed() drops nothing else
+SCRATCH_DATABASE = os.path.join(tempfile.mkdtemp(prefix='portfolio-utils-'), 'utils.db')
+
+
+def seed(size):
+    """Recreate the schema with one user holding size positions; returns (user_id, rebuild position)"""
+    from sqlalchemy import insert
+
+    from app import db, init_db
+    from models import User, Stock, Portfolio, Transaction
+    from providers import get_provider
+
+    if db.engine.url.database != SCRATCH_DATABASE:
+        raise RuntimeError(f"Refusing to reseed {db.engine.url!r}; only a temporary SQLite file is reseeded")
+    db.session.remove()
+    db.drop_all()
+    init_db()
+
+    provider = get_provider()
+    old = datetime.utcnow() - timedelta(days=1)
+    user = User(username='bench', email='bench@example.com', password_hash='-')
+    db.session.add(user)
+    db.session.flush()
+
+    # The extra last stock carries the position rebuilt from size transactions
+    symbols = [f"M{i:06d}" for i in range(size + 1)]
+    db.session.execute(insert(Stock), [
+        {'symbol': symbol, 'company_name': f"{symbol} Corp.",
+         'current_price': provider.get_quote(symbol)['current_price'] * 0.9, 'last_updated': old}
+        for symbol in symbols
+    ])
+    stock_ids = [row[0] for row in db.session.query(Stock.id).order_by(Stock.id)]
+    db.session.execute(insert(Portfolio), [
+        {'user_id': user.id, 'stock_id': stock_id, 'quantity': 10.0, 'average_buy_price': 20.0}
+        for stock_id in stock_ids
+    ])
+    rebuild_stock_id = stock_ids[-1]
+    db.session.execute(insert(Transaction), [
+        {'user_id': user.id, 'stock_id': rebuild_stock_id, 'transaction_type': 'BUY',
+         'quantity': 1.0, 'price': 10.0 + i % 50, 'timestamp': old + timedelta(seconds=i)}
+        for i in range(size)
+    ])
+    db.session.commit()
+    position = Portfolio.query.filter_by(user_id=user.id, stock_id=rebuild_stock_id).one()
+    return user.id, position.id
+
+
+def make_cases(user_id, position_id):
+    """Return {name: (setup, call)}; setup runs untimed and returns call's argument"""
+    from app import db
+    from models import Portfolio
+    from utils import (
+        calculate_portfolio_totals, get_portfolio_data_for_chart, get_portfolio_positions,
+        update_average_buy_price, update_stock_data,
+    )
+
+    def fresh_session():
+        db.session.remove()
+
+    def loaded_positions():
+        db.session.remove()
+        return get_portfolio_positions(user_id)
+
+    def rebuild_position():
+        db.session.remove()
+        return db.session.get(Portfolio, position_id)
+
+    return {
+        'calculate_portfolio_totals': (fresh_session, lambda _: calculate_portfolio_totals(user_id)),
+        'calculate_portfolio_totals_rows': (
+            loaded_positions, lambda positions: calculate_portfolio_totals(user_id, positions)
+        ),
+        'get_portfolio_data_for_chart': (fresh_session, lambda _: get_portfolio_data_for_chart(user_id)),
+        'update_average_buy_price': (rebuild_position, update_average_buy_price),
+        'update_stock_data': (fresh_session, lambda _: update_stock_data(max_age=timedelta(0))),
+    }
+
+
+def measure(setup, call, repeat):
+    """Time call over repeat runs, then trace one run's allocations"""
+    timings = []
+    for _ in range(repeat):
+        argument = setup()
+        started = time.perf_counter()
+        call(argument)
+        timings.append(time.perf_counter() - started)
+
+    argument = setup()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = call(argument)
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+
+    return {
+        'median': statistics.median(timings),
+        'min': min(timings),
+        'peak_bytes': peak - before,
+        'retained_bytes': after - before,
+    }
+
+
+def growth_exponents(sizes, values):
+    """Slope of log(value) against log(size) between consecutive sizes"""
+    exponents = []
+    for (n1, v1), (n2, v2) in zip(zip(sizes, values), zip(sizes[1:], values[1:])):
+        exponents.append(math.log(v2 / v1) / math.log(n2 / n1) if v1 > 0 and v2 > 0 else None)
+    return exponents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='Positions and transactions per case')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case and size')
+    parser.add_argument('--case', action='append', help='Run only these cases')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    # Always a throwaway database: every size drops and recreates the schema
+    os.environ['DATABASE_URL'] = 'sqlite:///' + SCRATCH_DATABASE
+    from app import create_app
+
+    app = create_app({
+        'PRICE_REFRESH_ENABLED': False,
+        'QUOTE_PROVIDER': 'local',
+        'METRICS_ENABLED': False,
+        'PROFILING_ENABLED': False,
+        'LOG_LEVEL': 'WARNING',
+    })
+
+    sizes = sorted(args.sizes)
+    results = {
+        'sizes': sizes,
+        'repeat': args.repeat,
+        'environment': {'python': platform.python_version(), 'platform': platform.platform()},
+        'cases': {},
+    }
+    with app.app_context():
+        for size in sizes:
+            started = time.perf_counter()
+            user_id, position_id = seed(size)
+            print(f"Seeded {size} positions in {time.perf_counter() - started:.1f}s")
+            for name, (setup, call) in make_cases(user_id, position_id).items():
+                if args.case and name not in args.case:
+                    continue
+                results['cases'].setdefault(name, {})[str(size)] = measure(setup, call, args.repeat)
+
+    print(f"{'case':>32} {'size':>8} {'median ms':>10} {'peak KiB':>10} {'retained KiB':>13} {'growth':>7}")
+    for name, by_size in results['cases'].items():
+        medians = [by_size[str(size)]['median'] for size in sizes]
+        exponents = growth_exponents(sizes, medians)
+        by_size['growth_exponents'] = exponents
+        by_size['superlinear'] = any(e is not None and e > SUPERLINEAR_EXPONENT for e in exponents)
+        for i, size in enumerate(sizes):
+            stats = by_size[str(size)]
+            growth = exponents[i - 1] if i else None
+            print(f"{name:>32} {size:>8} {stats['median'] * 1000:>10.2f} {stats['peak_bytes'] / 1024:>10.1f} "
+                  f"{stats['retained_bytes'] / 1024:>13.1f} {'' if growth is None else f'{growth:.2f}':>7}")
+    superlinear = [name for name, by_size in results['cases'].items() if by_size['superlinear']]
+    if superlinear:
+        print(f"Superlinear (growth exponent > {SUPERLINEAR_EXPONENT}): {', '.join(superlinear)}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Startup benchmark: how long a fresh worker process takes to become ready
+
+Each run starts a new interpreter, builds the app with create_app and serves
+one request through the test client, reporting the import/build time, the
+first request time and whether yfinance or pandas were loaded on the way.
+The cost of importing yfinance on its own is measured as a reference for
+what lazy loading saves.
+
+    python benchmarks/startup.py --runs 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER_SCRIPT = """
+import json, logging, sys, time
+started = time.perf_counter()
+from app import create_app
+app = create_app({'PRICE_REFRESH_ENABLED': False})
+ready = time.perf_counter()
+logging.disable(logging.CRITICAL)
+response = app.test_client().get('/login')
+served = time.perf_counter()
+print(json.dumps({
+    'create_app': ready - started,
+    'first_request': served - ready,
+    'status': response.status_code,
+    'yfinance_loaded': 'yfinance' in sys.modules,
+    'pandas_loaded': 'pandas' in sys.modules,
+}))
+"""
+
+REFERENCE_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import yfinance
+print(json.dumps({'import_yfinance': time.perf_counter() - started}))
+"""
+
+
+def run_python(script, env):
+    output = subprocess.run(
+        [sys.executable, '-c', script], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(values):
+    return {
+        'median': statistics.median(values),
+        'min': min(values),
+        'max': max(values),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5, help='Number of fresh processes to time')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'startup.db'))
+    env.setdefault('QUOTE_PROVIDER', 'local')
+    env['PYTHONPATH'] = ROOT
+
+    runs = [run_python(WORKER_SCRIPT, env) for _ in range(args.runs)]
+    reference = [run_python(REFERENCE_SCRIPT, env)['import_yfinance'] for _ in range(args.runs)]
+
+    results = {
+        'runs': args.runs,
+        'create_app': summarize([run['create_app'] for run in runs]),
+        'first_request': summarize([run['first_request'] for run in runs]),
+        'import_yfinance': summarize(reference),
+        'yfinance_loaded': any(run['yfinance_loaded'] for run in runs),
+        'pandas_loaded': any(run['pandas_loaded'] for run in runs),
+    }
+
+    for name in ('create_app', 'first_request', 'import_yfinance'):
+        stats = results[name]
+        print(f"{name:>16}: median {stats['median'] * 1000:.1f} ms "
+              f"(min {stats['min'] * 1000:.1f}, max {stats['max'] * 1000:.1f})")
+    print(f"yfinance loaded at startup: {results['yfinance_loaded']}, pandas: {results['pandas_loaded']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
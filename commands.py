@@ -0,0 +1,71 @@
+import click
+
+from app import db
+
+
+def register_commands(app):
+    """Register maintenance commands on the Flask CLI"""
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create missing database tables and indexes."""
+        from app import init_db
+
+        init_db()
+        click.echo('Database schema is up to date')
+
+    @app.cli.command('rebuild-positions')
+    @click.option('--user', 'user_id', type=int, default=None, help='Only rebuild this user id.')
+    def rebuild_positions_command(user_id):
+        """Recompute portfolio positions from the transaction log."""
+        from accounting import rebuild_positions
+
+        from snapshots import refresh_snapshots
+        from models import User
+
+        count = rebuild_positions(user_id)
+        user_ids = [user_id] if user_id is not None else [row[0] for row in db.session.query(User.id)]
+        refresh_snapshots(user_ids)
+        db.session.commit()
+        click.echo(f'Rebuilt {count} positions')
+
+    @app.cli.command('backfill-history')
+    @click.option('--days', type=int, default=365, show_default=True, help='Number of days to fetch.')
+    def backfill_history_command(days):
+        """Download daily price bars for every tracked stock."""
+        from price_history import backfill_history
+
+        inserted = backfill_history(days=days)
+        db.session.commit()
+        click.echo(f'Stored {inserted} price bars')
+
+    @app.cli.command('check-snapshots')
+    @click.option('--repair', is_flag=True, help='Rebuild inconsistent snapshots.')
+    def check_snapshots_command(repair):
+        """Compare portfolio snapshots with a full recomputation."""
+        from snapshots import check_snapshots
+
+        problems = check_snapshots(repair=repair)
+        for user_id, differences in problems.items():
+            for field, stored, expected in differences:
+                click.echo(f'user {user_id}: {field} stored={stored} expected={expected}')
+        if repair:
+            db.session.commit()
+        click.echo(f'{len(problems)} inconsistent snapshots' + (' repaired' if repair and problems else ''))
+
+    @app.cli.command('import-transactions')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--user', 'user_id', type=int, required=True, help='Import for this user id.')
+    def import_transactions_command(path, user_id):
+        """Bulk import transactions for a user from a CSV file."""
+        from symbols import load_symbol_directory
+        from transaction_import import import_transactions
+
+        # Company names for new stocks come from the symbol directory
+        load_symbol_directory(app)
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            result = import_transactions(user_id, f)
+        db.session.commit()
+        for line, message in result.errors:
+            click.echo(f'line {line}: {message}')
+        click.echo(result.summary())
@@ -1,4 +1,5 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, FloatField, SelectField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError, NumberRange
 from models import User
@@ -32,7 +33,8 @@ class RegistrationForm(FlaskForm):
 
 class AddStockForm(FlaskForm):
     """Form for adding a stock to portfolio"""
-    symbol = StringField('Stock Symbol', validators=[DataRequired(), Length(min=1, max=10)])
+    symbol = StringField('Stock Symbol', validators=[DataRequired(), Length(min=1, max=10)],
+                         render_kw={'autocomplete': 'off', 'data-symbol-autocomplete': 'true'})
     quantity = FloatField('Quantity', validators=[DataRequired(), NumberRange(min=0.01)])
     price = FloatField('Purchase Price Per Share', validators=[DataRequired(), NumberRange(min=0.01)])
     submit = SubmitField('Add Stock')
@@ -45,8 +47,14 @@ class SellStockForm(FlaskForm):
 
 class TransactionForm(FlaskForm):
     """Form for recording a new transaction"""
-    symbol = StringField('Stock Symbol', validators=[DataRequired(), Length(min=1, max=10)])
+    symbol = StringField('Stock Symbol', validators=[DataRequired(), Length(min=1, max=10)],
+                         render_kw={'autocomplete': 'off', 'data-symbol-autocomplete': 'true'})
     transaction_type = SelectField('Transaction Type', choices=[('BUY', 'Buy'), ('SELL', 'Sell')], validators=[DataRequired()])
     quantity = FloatField('Quantity', validators=[DataRequired(), NumberRange(min=0.01)])
     price = FloatField('Price Per Share', validators=[DataRequired(), NumberRange(min=0.01)])
     submit = SubmitField('Record Transaction')
+
+class ImportTransactionsForm(FlaskForm):
+    """Form for importing transactions from a CSV file"""
+    file = FileField('CSV File', validators=[FileRequired(), FileAllowed(['csv'], 'CSV files only')])
+    submit = SubmitField('Import Transactions')
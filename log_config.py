@@ -0,0 +1,138 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+_lock = threading.Lock()
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line
+
+    Fields passed with extra= are included as top-level keys, so
+    logger.info("Backfilled bars", extra={'inserted': n}) stays queryable
+    without parsing the message.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Already rendered by the queue handler
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class _PreparedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread
+
+    The stock prepare() runs the handler's formatter on the calling thread
+    and drops extras. Here only the message arguments are merged (they may
+    be mutable objects) and any traceback rendered to text, so the JSON
+    formatting and the write happen on the listener with extras intact.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_levels(spec):
+    """Parse "module=LEVEL,other.module=LEVEL" into {logger_name: level}"""
+    levels = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        name, _, level = item.partition('=')
+        level = level.strip().upper()
+        if not name.strip() or not isinstance(logging.getLevelName(level), int):
+            raise ValueError(f"Invalid log level setting: {item.strip()!r}")
+        levels[name.strip()] = level
+    return levels
+
+
+def configure_logging(level='INFO', levels=None, fmt='json', stream=None):
+    """
+    Route every log record through a queue to one background writer
+    Request threads only enqueue records; formatting and the write to
+    stream (stderr by default) happen on the listener thread. level sets
+    the root logger and levels maps logger names to their own level, e.g.
+    {'providers': 'DEBUG', 'sqlalchemy.engine': 'WARNING'}. Calling again
+    replaces the previous configuration.
+    """
+    global _listener
+
+    if fmt == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if isinstance(handler, logging.handlers.QueueHandler):
+                root.removeHandler(handler)
+        root.addHandler(_PreparedQueueHandler(log_queue))
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+        for name, module_level in (levels or {}).items():
+            logging.getLogger(name).setLevel(module_level)
+        listener.start()
+        _listener = listener
+    return listener
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(stop_logging)
+
+
+def init_app(app):
+    """Configure process logging from LOG_LEVEL, LOG_LEVELS and LOG_FORMAT"""
+    app.config.setdefault('LOG_LEVEL', 'INFO')
+    app.config.setdefault('LOG_LEVELS', '')
+    app.config.setdefault('LOG_FORMAT', 'json')
+    levels = app.config['LOG_LEVELS']
+    if isinstance(levels, str):
+        levels = parse_levels(levels)
+    return configure_logging(app.config['LOG_LEVEL'], levels, app.config['LOG_FORMAT'])
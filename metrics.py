@@ -0,0 +1,257 @@
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Queries-per-request buckets
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in sorted(values):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    """Cumulative bucketed histogram with optional labels, Prometheus style"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        # key -> [bucket counts..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(state[-2])}"
+            yield f"{self.name}_count{labels} {state[-1]}"
+
+
+class Registry:
+    """Collection of metrics rendered together in the Prometheus text format
+
+    Collectors are callables returning (name, kind, documentation, value)
+    tuples, for numbers read from elsewhere (e.g. cache stats) at scrape time.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collector in self.collectors:
+            for name, kind, documentation, value in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_latency = registry.register(Histogram(
+    'http_request_duration_seconds', 'Request latency by route.', ('endpoint', 'method', 'status')
+))
+request_queries = registry.register(Histogram(
+    'http_request_db_queries', 'SQL statements executed per request.', ('endpoint',), QUERY_COUNT_BUCKETS
+))
+request_query_time = registry.register(Histogram(
+    'http_request_db_seconds', 'Time spent executing SQL per request.', ('endpoint',)
+))
+db_queries = registry.register(Counter(
+    'db_queries_total', 'SQL statements executed, including outside requests.'
+))
+db_query_time = registry.register(Counter(
+    'db_query_seconds_total', 'Time spent executing SQL, including outside requests.'
+))
+quote_fetch_latency = registry.register(Histogram(
+    'quote_fetch_duration_seconds', 'Upstream quote provider call latency.', ('provider', 'operation')
+))
+quote_fetch_symbols = registry.register(Counter(
+    'quote_fetch_symbols_total', 'Symbols requested from the quote provider.', ('provider', 'operation')
+))
+quote_fetch_errors = registry.register(Counter(
+    'quote_fetch_errors_total', 'Symbols the quote provider failed to return, or calls that raised.',
+    ('provider', 'operation')
+))
+
+
+def record_quote_fetch(provider, operation, seconds, requested, succeeded):
+    """Record one provider call that asked for requested symbols and got succeeded back"""
+    quote_fetch_latency.observe(seconds, provider=provider, operation=operation)
+    quote_fetch_symbols.inc(requested, provider=provider, operation=operation)
+    if succeeded < requested:
+        quote_fetch_errors.inc(requested - succeeded, provider=provider, operation=operation)
+
+
+def timed_quote_fetch(operation, call, requested, count_results):
+    """
+    Run call() against the active provider and record its latency and errors
+    count_results maps the call's return value to the number of symbols it
+    delivered; an exception counts every requested symbol as failed.
+    """
+    from providers import get_provider
+
+    provider = get_provider().name
+    started = time.perf_counter()
+    try:
+        result = call()
+    except Exception:
+        record_quote_fetch(provider, operation, time.perf_counter() - started, requested, 0)
+        raise
+    record_quote_fetch(provider, operation, time.perf_counter() - started, requested, count_results(result))
+    return result
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    elapsed = time.perf_counter() - started
+    db_queries.inc()
+    db_query_time.inc(elapsed)
+    if has_request_context() and 'metrics_queries' in g:
+        g.metrics_queries += 1
+        g.metrics_query_time += elapsed
+
+def _discard_query_timer(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None:
+        started = context.connection.info.get('query_started')
+        if started:
+            started.pop()
+
+
+def _start_request_timer():
+    g.metrics_started = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_query_time = 0.0
+
+def _observe_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    # The route pattern, not the URL, keeps label cardinality bounded
+    endpoint = request.endpoint or 'unmatched'
+    request_latency.observe(time.perf_counter() - started, endpoint=endpoint,
+                            method=request.method, status=str(response.status_code))
+    request_queries.observe(g.pop('metrics_queries', 0), endpoint=endpoint)
+    request_query_time.observe(g.pop('metrics_query_time', 0.0), endpoint=endpoint)
+    return response
+
+
+def _quote_cache_stats():
+    import quote_cache
+
+    stats = quote_cache.get_cache().stats()
+    return [
+        ('quote_cache_size', 'gauge', 'Quotes held in the in-process cache.', stats['size']),
+        ('quote_cache_hits_total', 'counter', 'Quote cache hits.', stats['hits']),
+        ('quote_cache_misses_total', 'counter', 'Quote cache misses.', stats['misses']),
+        ('quote_cache_coalesced_total', 'counter', 'Lookups that waited on an in-flight fetch.', stats['coalesced']),
+        ('quote_cache_evictions_total', 'counter', 'Quotes evicted from the cache.', stats['evictions']),
+    ]
+
+
+def init_app(app):
+    """Time every request and SQL statement and serve the results on /metrics"""
+    app.config.setdefault('METRICS_ENABLED', True)
+    app.config.setdefault('METRICS_TOKEN', None)
+    if not app.config['METRICS_ENABLED']:
+        return registry
+
+    # Engine events are global, so listen only once
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _discard_query_timer)
+        registry.collectors.append(_quote_cache_stats)
+
+    app.before_request(_start_request_timer)
+    app.after_request(_observe_request)
+
+    token = app.config['METRICS_TOKEN']
+
+    def metrics():
+        """Prometheus scrape endpoint; requires the bearer token when METRICS_TOKEN is set"""
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
+    return registry
@@ -93,6 +93,16 @@ class Transaction(db.Model):
     price = db.Column(db.Float, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # (user_id, timestamp) serves history pages and date-range exports,
+    # (user_id, stock_id, transaction_type) position rebuilds, and
+    # timestamp the admin panel's newest-first listing across users
+    __table_args__ = (
+        db.Index('ix_transaction_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_transaction_user_stock_type', 'user_id', 'stock_id', 'transaction_type'),
+        db.Index('ix_transaction_stock_timestamp', 'stock_id', 'timestamp'),
+        db.Index('ix_transaction_timestamp', 'timestamp'),
+    )
+    
     @property
     def transaction_value(self):
         """Calculate total value of transaction"""
@@ -100,3 +110,45 @@ class Transaction(db.Model):
     
     def __repr__(self):
         return f'<Transaction {self.transaction_type} {self.stock.symbol if self.stock else "Unknown"} - {self.quantity}>'
+
+class PriceBar(db.Model):
+    """Daily OHLC price bar for a stock, one row per stock per trading day"""
+    id = db.Column(db.Integer, primary_key=True)
+    stock_id = db.Column(db.Integer, db.ForeignKey('stock.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    open = db.Column(db.Float, nullable=True)
+    high = db.Column(db.Float, nullable=True)
+    low = db.Column(db.Float, nullable=True)
+    close = db.Column(db.Float, nullable=False)
+    volume = db.Column(db.Float, nullable=True)
+    
+    # The unique constraint doubles as the (stock_id, date) range-query index
+    __table_args__ = (db.UniqueConstraint('stock_id', 'date', name='_stock_date_uc'),)
+    
+    def __repr__(self):
+        return f'<PriceBar {self.stock_id} {self.date} {self.close}>'
+
+class PortfolioSnapshot(db.Model):
+    """Materialized portfolio totals and chart data for a user, refreshed on write"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    total_current_value = db.Column(db.Float, nullable=False, default=0.0)
+    total_investment = db.Column(db.Float, nullable=False, default=0.0)
+    total_profit_loss = db.Column(db.Float, nullable=False, default=0.0)
+    profit_loss_percentage = db.Column(db.Float, nullable=False, default=0.0)
+    chart_labels = db.Column(db.Text, nullable=False, default='[]')  # JSON list
+    chart_values = db.Column(db.Text, nullable=False, default='[]')  # JSON list
+    chart_colors = db.Column(db.Text, nullable=False, default='[]')  # JSON list
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @property
+    def totals(self):
+        """Totals in the same shape as utils.calculate_portfolio_totals"""
+        return {
+            'total_current_value': self.total_current_value,
+            'total_investment': self.total_investment,
+            'total_profit_loss': self.total_profit_loss,
+            'profit_loss_percentage': self.profit_loss_percentage
+        }
+    
+    def __repr__(self):
+        return f'<PortfolioSnapshot {self.user_id} {self.total_current_value}>'
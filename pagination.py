@@ -0,0 +1,73 @@
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+class KeysetPage:
+    """One page of newest-first rows with cursors to the neighbouring pages
+
+    Cursors encode the (timestamp, id) of the last row on the page, so
+    fetching any page is an index range scan rather than an OFFSET over
+    every newer row.
+    """
+
+    def __init__(self, items, has_next, has_prev):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+
+    @property
+    def next_cursor(self):
+        """Cursor for the page of older rows"""
+        return encode_cursor(self.items[-1]) if self.items and self.has_next else None
+
+    @property
+    def prev_cursor(self):
+        """Cursor for the page of newer rows"""
+        return encode_cursor(self.items[0]) if self.items and self.has_prev else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(row):
+    return f"{row.timestamp.isoformat()}_{row.id}"
+
+def decode_cursor(cursor):
+    """Return (timestamp, id) from a cursor, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        timestamp, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        return None
+
+
+def keyset_paginate(query, model, per_page, before=None, after=None):
+    """
+    Page a query newest first by (model.timestamp, model.id)
+    before returns the page of rows older than that cursor and after the
+    page of rows newer than it; with neither, the newest page is returned.
+    The query should already be filtered so an index on (filter columns,
+    timestamp) can serve the range.
+    """
+    key = tuple_(model.timestamp, model.id)
+    before = decode_cursor(before)
+    after = decode_cursor(after) if before is None else None
+
+    if after is not None:
+        # Walk forward from the cursor, then flip back to newest first
+        rows = query.filter(key > after).order_by(
+            model.timestamp.asc(), model.id.asc()
+        ).limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        return KeysetPage(list(reversed(rows[:per_page])), has_next=True, has_prev=has_prev)
+
+    if before is not None:
+        query = query.filter(key < before)
+    rows = query.order_by(model.timestamp.desc(), model.id.desc()).limit(per_page + 1).all()
+    return KeysetPage(rows[:per_page], has_next=len(rows) > per_page, has_prev=before is not None)
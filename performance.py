@@ -0,0 +1,245 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func
+
+from app import db
+from models import Stock, Transaction, PriceBar
+from price_history import forward_fill, get_close_matrix
+
+
+class _Curve:
+    """Cached per-user replay state: daily holdings, cost basis and closes per stock"""
+
+    def __init__(self, start):
+        self.stock_ids = []
+        self.dates = np.array([start], dtype='datetime64[D]')
+        self.holdings = np.zeros((1, 0))
+        self.cost = np.zeros((1, 0))
+        self.closes = np.zeros((1, 0))
+        # stock_id -> [quantity, average price] after the last applied transaction
+        self.state = {}
+        self.watermark = (0, 0)
+
+    @property
+    def start(self):
+        return self.dates[0].item()
+
+    @property
+    def end(self):
+        return self.dates[-1].item()
+
+    def add_stocks(self, stock_ids):
+        """Append zero columns for stocks seen for the first time"""
+        new_ids = [stock_id for stock_id in stock_ids if stock_id not in self.state]
+        if not new_ids:
+            return
+        for stock_id in new_ids:
+            self.state[stock_id] = [0.0, 0.0]
+        self.stock_ids.extend(new_ids)
+        padding = np.zeros((len(self.dates), len(new_ids)))
+        self.holdings = np.hstack([self.holdings, padding])
+        self.cost = np.hstack([self.cost, padding])
+        _, closes = get_close_matrix(new_ids, self.start, self.end)
+        self.closes = np.hstack([self.closes, closes])
+
+    def extend_to(self, end):
+        """Carry positions forward to end and reload closes from the last cached day"""
+        last = self.end
+        if end > last:
+            new_dates = np.arange(np.datetime64(last, 'D') + 1, np.datetime64(end, 'D') + 1)
+            self.dates = np.concatenate([self.dates, new_dates])
+            self.holdings = np.vstack([self.holdings, np.repeat(self.holdings[-1:], len(new_dates), axis=0)])
+            self.cost = np.vstack([self.cost, np.repeat(self.cost[-1:], len(new_dates), axis=0)])
+            self.closes = np.vstack([self.closes, np.full((len(new_dates), len(self.stock_ids)), np.nan)])
+
+        # The last cached day's bar may have moved intraday, so reload from there
+        if self.stock_ids:
+            first = len(self.dates) - 1 - (self.end - last).days
+            _, closes = get_close_matrix(self.stock_ids, last, self.end)
+            self.closes[first:] = closes
+
+    def reload_backfilled(self):
+        """Reload the columns of stocks whose history was backfilled since they were loaded"""
+        known = ~np.isnan(self.closes)
+        gaps = [i for i in range(len(self.stock_ids)) if not known[0, i]]
+        if not gaps:
+            return
+        first_bars = dict(db.session.query(PriceBar.stock_id, func.min(PriceBar.date)).filter(
+            PriceBar.stock_id.in_([self.stock_ids[i] for i in gaps])
+        ).group_by(PriceBar.stock_id).all())
+        # A column is stale if its first bar is now earlier than its first known close
+        stale = []
+        for i in gaps:
+            first_bar = first_bars.get(self.stock_ids[i])
+            first_known = np.argmax(known[:, i]) if known[:, i].any() else len(self.dates)
+            if first_bar is not None and (max(first_bar, self.start) - self.start).days < first_known:
+                stale.append(i)
+        if stale:
+            _, closes = get_close_matrix([self.stock_ids[i] for i in stale], self.start, self.end)
+            self.closes[:, stale] = closes
+
+    def apply(self, transactions):
+        """Apply (stock_id, type, quantity, price, date) rows, in order, on or after start"""
+        if not transactions:
+            return
+        self.add_stocks(sorted({row[0] for row in transactions}))
+        column = {stock_id: i for i, stock_id in enumerate(self.stock_ids)}
+
+        days, columns, quantity_deltas, cost_deltas = [], [], [], []
+        for stock_id, transaction_type, quantity, price, day in transactions:
+            position = self.state[stock_id]
+            # Same average cost rules as accounting.replay_transactions
+            if transaction_type == 'BUY':
+                cost_delta = quantity * price
+                position[1] = (position[0] * position[1] + cost_delta) / (position[0] + quantity)
+                position[0] += quantity
+            else:
+                sold = min(quantity, position[0])
+                quantity = -sold
+                cost_delta = -sold * position[1]
+                position[0] -= sold
+                if position[0] <= 0:
+                    position[0], position[1] = 0.0, 0.0
+            days.append((day - self.start).days)
+            columns.append(column[stock_id])
+            quantity_deltas.append(quantity)
+            cost_deltas.append(cost_delta)
+
+        # Scatter the per-transaction deltas onto days, then accumulate forward in time
+        delta = np.zeros_like(self.holdings)
+        np.add.at(delta, (days, columns), quantity_deltas)
+        self.holdings += np.cumsum(delta, axis=0)
+        delta[:] = 0
+        np.add.at(delta, (days, columns), cost_deltas)
+        self.cost += np.cumsum(delta, axis=0)
+
+    def series(self, start=None, today=None, current_prices=None):
+        """
+        Value, cost basis and P/L per day from start, as plain lists
+        Days without a bar carry the last known close forward, and from
+        today on current_prices (stock_id -> price) replace the closes.
+        """
+        closes = self.closes.copy()
+        if today is not None and current_prices:
+            first_live = max(0, (today - self.start).days)
+            for i, stock_id in enumerate(self.stock_ids):
+                if current_prices.get(stock_id) is not None:
+                    closes[first_live:, i] = current_prices[stock_id]
+        closes = forward_fill(closes)
+
+        first = 0 if start is None else max(0, (start - self.start).days)
+        holdings = self.holdings[first:]
+        cost = self.cost[first:]
+        closes = closes[first:]
+        # Before a stock's first known close, its position is valued at cost basis
+        values = np.where(np.isnan(closes), cost, holdings * np.nan_to_num(closes)).sum(axis=1)
+        cost_basis = cost.sum(axis=1)
+        return {
+            'dates': [str(day) for day in self.dates[first:]],
+            'values': np.round(values, 2).tolist(),
+            'cost_basis': np.round(cost_basis, 2).tolist(),
+            'profit_loss': np.round(values - cost_basis, 2).tolist()
+        }
+
+
+class PerformanceEngine:
+    """Builds and caches portfolio value-over-time curves per user
+
+    A curve is built once from the user's full transaction log and the local
+    daily price history, then extended incrementally: new days only reload
+    the tail of the price matrix, and transactions dated on or after the
+    last cached day are applied as deltas. Anything else (deleted or
+    backdated transactions) triggers a full rebuild. Nothing is fetched
+    upstream here: the price refresh scheduler backfills missing history,
+    and stocks that gained earlier bars since are reloaded on next use.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._curves = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_series(self, user_id, days=365, today=None):
+        """Return daily dates, values, cost basis and P/L for the last `days` days"""
+        today = today or datetime.utcnow().date()
+        with self._lock:
+            curve = self._curves.pop(user_id, None)
+        curve = self._refresh(user_id, curve, today)
+        with self._lock:
+            self._curves[user_id] = curve
+            while len(self._curves) > self.maxsize:
+                self._curves.popitem(last=False)
+
+        if curve is None:
+            return {'dates': [], 'values': [], 'cost_basis': [], 'profit_loss': []}
+        current_prices = dict(db.session.query(Stock.id, Stock.current_price).filter(
+            Stock.id.in_(curve.stock_ids)
+        ).all())
+        return curve.series(today - timedelta(days=days - 1), today, current_prices)
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._curves.clear()
+            else:
+                self._curves.pop(user_id, None)
+
+    def _refresh(self, user_id, curve, today):
+        watermark = db.session.query(
+            func.count(Transaction.id), func.coalesce(func.max(Transaction.id), 0)
+        ).filter(Transaction.user_id == user_id).one()
+        watermark = (watermark[0], watermark[1])
+        if watermark[0] == 0:
+            return None
+
+        if curve is not None and watermark != curve.watermark:
+            new_transactions = self._load_transactions(user_id, after_id=curve.watermark[1])
+            # Incremental only if nothing was deleted and nothing is backdated
+            if (curve.watermark[0] + len(new_transactions) != watermark[0]
+                    or any(row[4] < curve.end for row in new_transactions)):
+                curve = None
+            else:
+                curve.extend_to(max([today] + [row[4] for row in new_transactions]))
+                curve.apply(new_transactions)
+                curve.watermark = watermark
+                curve.reload_backfilled()
+                return curve
+
+        if curve is None:
+            return self._build(user_id, watermark, today)
+
+        curve.extend_to(today)
+        curve.reload_backfilled()
+        return curve
+
+    def _build(self, user_id, watermark, today):
+        transactions = self._load_transactions(user_id)
+        start = min(transactions[0][4], today)
+        end = max(transactions[-1][4], today)
+
+        curve = _Curve(start)
+        curve.extend_to(end)
+        curve.apply(transactions)
+        curve.watermark = watermark
+        return curve
+
+    @staticmethod
+    def _load_transactions(user_id, after_id=0):
+        rows = db.session.query(
+            Transaction.stock_id, Transaction.transaction_type, Transaction.quantity,
+            Transaction.price, Transaction.timestamp
+        ).filter(
+            Transaction.user_id == user_id, Transaction.id > after_id
+        ).order_by(Transaction.timestamp, Transaction.id).all()
+        return [(stock_id, kind, quantity, price, timestamp.date())
+                for stock_id, kind, quantity, price, timestamp in rows]
+
+
+performance_engine = PerformanceEngine()
+
+def get_portfolio_value_series(user_id, days=365):
+    """Daily portfolio value, cost basis and P/L for a user over the last `days` days"""
+    return performance_engine.get_series(user_id, days=days)
@@ -0,0 +1,179 @@
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, select, union_all
+
+from app import db
+from models import Stock, PriceBar, Transaction
+from providers import get_provider
+from metrics import timed_quote_fetch
+
+logger = logging.getLogger(__name__)
+
+
+def record_prices(prices, when=None):
+    """
+    Fold current prices into today's daily bars
+    prices is a dict of stock_id to price. Existing bars for the day get
+    their high, low and close updated; missing ones are created with the
+    price as open. Adds to the session without committing.
+    """
+    if not prices:
+        return 0
+    day = (when or datetime.utcnow()).date()
+
+    existing = {
+        bar.stock_id: bar
+        for bar in PriceBar.query.filter(
+            PriceBar.date == day, PriceBar.stock_id.in_(list(prices))
+        ).all()
+    }
+    for stock_id, price in prices.items():
+        bar = existing.get(stock_id)
+        if bar is None:
+            db.session.add(PriceBar(stock_id=stock_id, date=day, open=price,
+                                    high=price, low=price, close=price))
+        else:
+            bar.high = max(bar.high or price, price)
+            bar.low = min(bar.low or price, price)
+            bar.close = price
+    return len(prices)
+
+
+def record_bars(stock_id, bars):
+    """
+    Store (date, open, high, low, close, volume) bars for one stock
+    Days that already have a bar are left untouched. Returns the number of
+    bars inserted. Adds to the session without committing.
+    """
+    if not bars:
+        return 0
+    days = [bar[0] for bar in bars]
+    known = {
+        row[0] for row in db.session.query(PriceBar.date).filter(
+            PriceBar.stock_id == stock_id, PriceBar.date.between(min(days), max(days))
+        )
+    }
+    rows = [
+        {'stock_id': stock_id, 'date': day, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+        for day, o, h, l, c, v in bars if day not in known
+    ]
+    if rows:
+        db.session.execute(PriceBar.__table__.insert(), rows)
+    return len(rows)
+
+
+def backfill_history(stocks=None, days=365):
+    """Fetch daily bars for the last `days` days from the quote provider and store them"""
+    stocks = stocks if stocks is not None else Stock.query.all()
+    if not stocks:
+        return 0
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=days)
+
+    symbols = [stock.symbol.upper() for stock in stocks]
+    history = timed_quote_fetch('history', lambda: get_provider().get_history(symbols, start, end),
+                                len(symbols), len)
+    inserted = 0
+    for stock in stocks:
+        inserted += record_bars(stock.id, history.get(stock.symbol.upper(), []))
+    logger.info("Backfilled %s price bars for %s stocks", inserted, len(stocks),
+                extra={'inserted': inserted, 'stocks': len(stocks)})
+    return inserted
+
+
+def backfill_missing_history(skip=()):
+    """
+    Backfill, in one bulk fetch, traded stocks whose local history starts
+    more than a few days after their first transaction (allowing for
+    weekends and holidays), except the stock ids in skip. Returns the ids
+    fetched. Adds to the session without committing.
+    """
+    first_trades = dict(db.session.query(
+        Transaction.stock_id, func.min(Transaction.timestamp)
+    ).group_by(Transaction.stock_id).all())
+    first_bars = dict(db.session.query(
+        PriceBar.stock_id, func.min(PriceBar.date)
+    ).group_by(PriceBar.stock_id).all())
+    missing = {
+        stock_id: first_trade.date() for stock_id, first_trade in first_trades.items()
+        if stock_id not in skip and (stock_id not in first_bars
+                                     or first_bars[stock_id] > first_trade.date() + timedelta(days=5))
+    }
+    if not missing:
+        return []
+    stocks = Stock.query.filter(Stock.id.in_(list(missing))).all()
+    backfill_history(stocks, days=(datetime.utcnow().date() - min(missing.values())).days + 1)
+    return list(missing)
+
+
+def forward_fill(values):
+    """Copy of a 2-D array with each column's NaNs replaced by the last value above them"""
+    filled = np.where(~np.isnan(values), np.arange(len(values))[:, None], 0)
+    np.maximum.accumulate(filled, axis=0, out=filled)
+    return values[filled, np.arange(values.shape[1])]
+
+
+def get_price_series(stock_id, start=None, end=None):
+    """
+    Return (dates, closes) for one stock as NumPy arrays in date order
+    dates has dtype datetime64[D] and closes float64.
+    """
+    query = db.session.query(PriceBar.date, PriceBar.close).filter(PriceBar.stock_id == stock_id)
+    if start is not None:
+        query = query.filter(PriceBar.date >= start)
+    if end is not None:
+        query = query.filter(PriceBar.date <= end)
+    rows = query.order_by(PriceBar.date).all()
+
+    if not rows:
+        return np.array([], dtype='datetime64[D]'), np.array([], dtype=np.float64)
+    days, closes = zip(*rows)
+    return np.array(days, dtype='datetime64[D]'), np.array(closes, dtype=np.float64)
+
+
+def get_close_matrix(stock_ids, start, end):
+    """
+    Return (dates, closes) for many stocks aligned on a common daily calendar
+    dates covers every day from start to end; closes has one row per date
+    and one column per stock id, forward-filled across days without a bar
+    and NaN before a stock's first bar. Uses a single query.
+    """
+    stock_ids = list(stock_ids)
+    dates = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+    closes = np.full((len(dates), len(stock_ids)), np.nan)
+    if not stock_ids or not len(dates):
+        return dates, closes
+
+    # Bars in range, plus each stock's last bar before start (however long
+    # ago) so the first day can be filled. A Core select skips ORM row
+    # construction, which dominates at this size
+    previous = select(PriceBar.stock_id, func.max(PriceBar.date).label('date')).where(
+        PriceBar.stock_id.in_(stock_ids), PriceBar.date < start
+    ).group_by(PriceBar.stock_id).subquery()
+    rows = db.session.execute(union_all(
+        select(PriceBar.stock_id, PriceBar.date, PriceBar.close).where(
+            PriceBar.stock_id.in_(stock_ids), PriceBar.date.between(start, end)
+        ),
+        select(PriceBar.stock_id, PriceBar.date, PriceBar.close).join(previous, (
+            (PriceBar.stock_id == previous.c.stock_id) & (PriceBar.date == previous.c.date)
+        ))
+    )).all()
+
+    column = {stock_id: i for i, stock_id in enumerate(stock_ids)}
+    if rows:
+        first_ordinal = start.toordinal()
+        ordinals = np.fromiter((row[1].toordinal() - first_ordinal for row in rows),
+                               dtype=np.int64, count=len(rows))
+        columns = np.fromiter((column[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+        values = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+        # The bar before start lands on the first day; where that day has its
+        # own bar, keep only the latest bar per (day, stock) before assigning
+        positions = np.clip(ordinals, 0, None)
+        order = np.lexsort((ordinals, positions * len(stock_ids) + columns))
+        keys = (positions * len(stock_ids) + columns)[order]
+        last = order[np.append(keys[1:] != keys[:-1], True)]
+        closes[positions[last], columns[last]] = values[last]
+
+    return dates, forward_fill(closes)
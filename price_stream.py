@@ -0,0 +1,228 @@
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event, inspect
+
+from app import db
+from models import Stock
+
+logger = logging.getLogger(__name__)
+
+# Seconds between keep-alive comments on an idle stream
+STREAM_HEARTBEAT = 15
+
+
+class PriceBroker:
+    """In-process fan-out of stock price changes to waiting clients
+
+    Only the latest price per stock is kept, tagged with a version number
+    that increases with every publish. A client remembers the last version
+    it saw and receives every held stock whose version is newer, so a
+    reconnecting client never misses the latest price however many updates
+    happened in between. Versions only mean something to the process that
+    issued them, so event ids also carry a per-process epoch; an id from
+    another worker or from before a restart is not resumed from. Waiting
+    clients block on one shared Condition; under a gevent worker that is a
+    greenlet rather than a thread each.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._version = 0
+        # stock_id -> (version, symbol, price)
+        self._latest = {}
+        self._epoch = None
+        self._epoch_pid = None
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def epoch(self):
+        """Random token naming this process's version counter, new after a fork"""
+        if self._epoch_pid != os.getpid():
+            self._epoch = secrets.token_hex(4)
+            self._epoch_pid = os.getpid()
+        return self._epoch
+
+    def event_id(self, version):
+        return f'{self.epoch}-{version}'
+
+    def parse_event_id(self, event_id):
+        """Return the version of an event id this process issued, or None for any other id"""
+        epoch, _, version = (event_id or '').partition('-')
+        if epoch != self.epoch or not version.isdigit() or int(version) > self._version:
+            return None
+        return int(version)
+
+    def publish(self, prices):
+        """Publish {stock_id: (symbol, price)} and wake every waiting client"""
+        if not prices:
+            return self._version
+        with self._condition:
+            self._version += 1
+            for stock_id, (symbol, price) in prices.items():
+                self._latest[stock_id] = (self._version, symbol, price)
+            self._condition.notify_all()
+            return self._version
+
+    def changes_since(self, since, stock_ids):
+        """Return {symbol: price} for the given stocks published after version since"""
+        changes = {}
+        for stock_id in stock_ids:
+            latest = self._latest.get(stock_id)
+            if latest is not None and latest[0] > since:
+                changes[latest[1]] = latest[2]
+        return changes
+
+    def wait(self, since, stock_ids, timeout):
+        """
+        Block until one of the stocks changes after version since or timeout passes
+        Returns (version, changes); changes is empty on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                changes = self.changes_since(since, stock_ids)
+                remaining = deadline - time.monotonic()
+                if changes or remaining <= 0:
+                    return self._version, changes
+                self._condition.wait(remaining)
+
+    def stream(self, stock_ids, since=None, heartbeat=STREAM_HEARTBEAT, max_duration=None, initial=None):
+        """
+        Yield Server-Sent Events with price changes for the given stocks
+        since is a version from parse_event_id; initial, a {symbol: price}
+        dict, is sent first when the client's last event id could not be
+        resumed from. With max_duration the stream ends after that many
+        seconds; EventSource then reconnects, sending the last event id so
+        nothing is missed, and the worker serving it is released in between.
+        """
+        stock_ids = list(stock_ids)
+        version = self._version if since is None else since
+        deadline = time.monotonic() + max_duration if max_duration else None
+        # Tell EventSource to wait a few seconds before reconnecting
+        yield 'retry: 5000\n\n'
+        if initial:
+            data = json.dumps({'version': version, 'prices': initial})
+            yield f'id: {self.event_id(version)}\nevent: prices\ndata: {data}\n\n'
+        while True:
+            timeout = heartbeat
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                timeout = min(timeout, remaining)
+            version, changes = self.wait(version, stock_ids, timeout)
+            if changes:
+                data = json.dumps({'version': version, 'prices': changes})
+                yield f'id: {self.event_id(version)}\nevent: prices\ndata: {data}\n\n'
+            else:
+                yield ': keep-alive\n\n'
+
+
+price_broker = PriceBroker()
+
+
+def _collect_price_changes(session, flush_context):
+    """Remember stocks whose price was written in this flush until the commit"""
+    changes = session.info.setdefault('price_changes', {})
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Stock) or not obj.current_price:
+            continue
+        if inspect(obj).attrs.current_price.history.has_changes():
+            changes[obj.id] = (obj.symbol, obj.current_price)
+
+def _publish_price_changes(session):
+    changes = session.info.pop('price_changes', None)
+    if changes:
+        price_broker.publish(changes)
+
+def _discard_price_changes(session, previous_transaction=None):
+    session.info.pop('price_changes', None)
+
+
+class PriceWatcher:
+    """Publishes prices written to Stock by other processes
+
+    Session events only see writes made by this process. With several
+    workers, the one holding the refresh lease writes the prices, so every
+    other worker polls Stock.last_updated on one background thread and
+    publishes what changed.
+    """
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self.watermark = datetime.utcnow()
+        self._prices = {}
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='price-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def poll_once(self):
+        """Publish stocks updated since the last poll whose price actually moved"""
+        with self.app.app_context():
+            try:
+                rows = db.session.query(
+                    Stock.id, Stock.symbol, Stock.current_price, Stock.last_updated
+                ).filter(Stock.last_updated > self.watermark).all()
+            finally:
+                db.session.remove()
+
+        changes = {}
+        for stock_id, symbol, price, last_updated in rows:
+            self.watermark = max(self.watermark, last_updated)
+            if price and self._prices.get(stock_id) != price:
+                self._prices[stock_id] = price
+                changes[stock_id] = (symbol, price)
+        price_broker.publish(changes)
+        return len(changes)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.error("Price watcher poll failed: %s", e)
+
+
+def init_app(app):
+    """Publish committed price writes to the broker, and prepare polling for other processes' writes"""
+    app.config.setdefault('PRICE_STREAM_ENABLED', False)
+    app.config.setdefault('PRICE_STREAM_MAX_DURATION', 300)
+    app.config.setdefault('PRICE_STREAM_POLL_INTERVAL', 0)
+
+    # The session is shared by every app, so listen only once
+    if not event.contains(db.session, 'after_commit', _publish_price_changes):
+        event.listen(db.session, 'after_flush', _collect_price_changes)
+        event.listen(db.session, 'after_commit', _publish_price_changes)
+        event.listen(db.session, 'after_soft_rollback', _discard_price_changes)
+
+    interval = float(app.config['PRICE_STREAM_POLL_INTERVAL'])
+    if interval > 0:
+        app.extensions['price_watcher'] = PriceWatcher(app, interval)
+    return price_broker
+
+def start_watcher(app):
+    """Start the app's price watcher, if polling is configured"""
+    watcher = app.extensions.get('price_watcher')
+    if watcher is not None:
+        watcher.start()
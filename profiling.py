@@ -0,0 +1,264 @@
+import cProfile
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import Response, abort, g, jsonify, request
+from flask_login import current_user
+
+logger = logging.getLogger(__name__)
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+
+# Profiles kept on disk; the oldest are deleted past this
+MAX_PROFILES = 100
+
+# Stored profile names, as generated by ProfileStore.save
+_PROFILE_NAME = re.compile(r'^[\w.-]+\.(folded|prof)$')
+_UNSAFE_NAME_CHARS = re.compile(r'[^\w.-]+')
+
+# ?profile= and X-Profile values that leave profiling off
+_OFF_VALUES = frozenset({'', '0', 'false', 'off', 'no'})
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def collapse_stack(frame):
+    """Return a frame's stack root first as one line of the collapsed (folded) format"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+def format_collapsed(stacks):
+    """Render a Counter of collapsed stacks as flamegraph.pl / speedscope input"""
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class StackSampler:
+    """Samples the Python stacks of registered threads from one background thread
+
+    A thread is registered with a start time and a delay; it is only sampled
+    once it has been running longer than the delay, so requests that finish
+    quickly cost one dict insert and delete and are never sampled. The
+    sampler thread sleeps until the earliest delay runs out, and blocks
+    while nothing is registered. Stacks are read with sys._current_frames,
+    so under gevent only the hub's own thread is seen.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        # thread id -> (sample after, Counter of stacks)
+        self._active = {}
+        self._thread = None
+
+    def begin(self, delay=0.0, thread_id=None):
+        """Start sampling the current (or given) thread once delay seconds have passed"""
+        thread_id = thread_id or threading.get_ident()
+        with self._lock:
+            self._active[thread_id] = (time.monotonic() + delay, Counter())
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def end(self, thread_id=None):
+        """Stop sampling a thread and return its Counter of collapsed stacks (empty if never sampled)"""
+        with self._lock:
+            entry = self._active.pop(thread_id or threading.get_ident(), None)
+        return entry[1] if entry else Counter()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                next_due = min((after for after, _ in self._active.values()), default=None)
+                self._wake.clear()
+            now = time.monotonic()
+            # Sleep until something is registered or the next thread is due
+            if next_due is None:
+                self._wake.wait()
+                continue
+            if next_due > now:
+                self._wake.wait(next_due - now)
+                continue
+
+            with self._lock:
+                due = [(tid, stacks) for tid, (after, stacks) in self._active.items() if now >= after]
+            frames = sys._current_frames()
+            for thread_id, stacks in due:
+                frame = frames.get(thread_id)
+                if frame is not None and thread_id != own_id:
+                    stacks[collapse_stack(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+class ProfileStore:
+    """Directory of saved profiles, pruned to the newest max_profiles files"""
+
+    def __init__(self, path, max_profiles=MAX_PROFILES):
+        self.path = path
+        self.max_profiles = max_profiles
+
+    def save(self, label, extension, write):
+        """Create a file named after label and call write(path); returns the file name"""
+        os.makedirs(self.path, exist_ok=True)
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        name = f"{stamp}-{_UNSAFE_NAME_CHARS.sub('_', label)}.{extension}"
+        write(os.path.join(self.path, name))
+        self._prune()
+        return name
+
+    def list(self):
+        """Return stored profile names, newest first"""
+        try:
+            names = [name for name in os.listdir(self.path) if _PROFILE_NAME.match(name)]
+        except FileNotFoundError:
+            return []
+        return sorted(names, reverse=True)
+
+    def path_for(self, name):
+        """Return the file path of a stored profile, or None for unknown names"""
+        if not _PROFILE_NAME.match(name) or name not in self.list():
+            return None
+        return os.path.join(self.path, name)
+
+    def _prune(self):
+        for name in self.list()[self.max_profiles:]:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+
+def _write_text(text):
+    def write(path):
+        with open(path, 'w') as f:
+            f.write(text)
+    return write
+
+def _request_label(elapsed):
+    return f"{request.endpoint or 'unmatched'}-{elapsed * 1000:.0f}ms"
+
+
+def init_app(app):
+    """
+    Profile individual requests on demand, and slow requests automatically
+    An admin adds ?profile=1 (or an X-Profile: 1 header) to any request to
+    sample its stacks into a collapsed flamegraph file; profile=cprofile
+    saves cProfile stats instead, and 0, false or off profile nothing. The
+    response carries the stored file name in an X-Profile header, and
+    /admin/profiles serves the files. With PROFILE_SLOW_REQUEST_THRESHOLD
+    set, any request still running after that many seconds is sampled from
+    then on and its stacks saved.
+    """
+    app.config.setdefault('PROFILING_ENABLED', True)
+    app.config.setdefault('PROFILE_SLOW_REQUEST_THRESHOLD', 0)
+    app.config.setdefault('PROFILE_SAMPLE_INTERVAL', SAMPLE_INTERVAL)
+    app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+    app.config.setdefault('PROFILE_MAX_FILES', MAX_PROFILES)
+    if not app.config['PROFILING_ENABLED']:
+        return None
+
+    store = ProfileStore(app.config['PROFILE_DIR'], int(app.config['PROFILE_MAX_FILES']))
+    sampler = StackSampler(float(app.config['PROFILE_SAMPLE_INTERVAL']))
+    threshold = float(app.config['PROFILE_SLOW_REQUEST_THRESHOLD'] or 0)
+    app.extensions['profiling'] = store
+
+    def start_profile():
+        # Read the WSGI environ directly so untriggered requests stay cheap
+        environ = request.environ
+        mode = environ.get('HTTP_X_PROFILE')
+        if mode is None and 'profile' in environ.get('QUERY_STRING', ''):
+            mode = request.args.get('profile')
+        if mode is not None and mode.strip().lower() in _OFF_VALUES:
+            mode = None
+        if mode and current_user.is_authenticated and current_user.is_admin:
+            if mode == 'cprofile':
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                    g.profiling = ('cprofile', time.perf_counter(), profile)
+                    return
+                except ValueError:
+                    # Only one cProfile may run at a time; sample this request instead
+                    pass
+            sampler.begin()
+            g.profiling = ('sample', time.perf_counter(), None)
+        elif threshold:
+            sampler.begin(threshold)
+            g.profiling = ('slow', time.perf_counter(), None)
+
+    def finish_profile(response):
+        state = g.get('profiling')
+        if state is None or state[0] == 'slow':
+            return response
+        g.profiling = None
+        kind, started, profile = state
+        label = _request_label(time.perf_counter() - started)
+        if kind == 'cprofile':
+            profile.disable()
+            name = store.save(label, 'prof', profile.dump_stats)
+        else:
+            name = store.save(label, 'folded', _write_text(format_collapsed(sampler.end())))
+        response.headers['X-Profile'] = name
+        logger.info("Saved request profile %s", name, extra={'profile': name})
+        return response
+
+    def finish_request(exc=None):
+        # Runs last and after errors too, so no profiler is left running
+        state = g.pop('profiling', None)
+        if state is None:
+            return
+        kind, started, profile = state
+        if kind == 'cprofile':
+            profile.disable()
+            return
+        stacks = sampler.end()
+        if kind == 'slow' and stacks:
+            elapsed = time.perf_counter() - started
+            name = store.save(f"slow-{_request_label(elapsed)}", 'folded', _write_text(format_collapsed(stacks)))
+            logger.warning("Slow request %s %s took %.3fs, saved profile %s",
+                           request.method, request.path, elapsed, name,
+                           extra={'profile': name, 'seconds': round(elapsed, 3)})
+
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    app.teardown_request(finish_request)
+
+    def admin_required():
+        if not (current_user.is_authenticated and current_user.is_admin):
+            abort(403)
+
+    def list_profiles():
+        """Stored profile names, newest first (admin only)"""
+        admin_required()
+        return jsonify({'profiles': store.list()})
+
+    def get_profile(name):
+        """Download one stored profile (admin only)"""
+        admin_required()
+        path = store.path_for(name)
+        if path is None:
+            abort(404)
+        if name.endswith('.folded'):
+            with open(path) as f:
+                return Response(f.read(), mimetype='text/plain')
+        with open(path, 'rb') as f:
+            return Response(f.read(), mimetype='application/octet-stream',
+                            headers={'Content-Disposition': f'attachment; filename={name}'})
+
+    app.add_url_rule('/admin/profiles', 'profiles', list_profiles)
+    app.add_url_rule('/admin/profiles/<name>', 'profile', get_profile)
+    return store
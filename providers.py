@@ -0,0 +1,324 @@
+import json
+import logging
+import time
+import zlib
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+# Number of symbols requested per bulk download
+QUOTE_BATCH_SIZE = 200
+
+
+class QuoteProvider:
+    """Base class for quote sources used by get_stock_info and update_stock_data
+
+    A quote is a dict with symbol, company_name and current_price keys.
+    Subclasses must implement get_quote; get_quotes may be overridden when the
+    source supports fetching many symbols at once.
+    """
+
+    name = 'base'
+
+    def get_quote(self, symbol):
+        """Return the quote for a single symbol, or None if it is unknown"""
+        raise NotImplementedError
+
+    def get_quotes(self, symbols):
+        """Return a dict of quotes with a usable price keyed by symbol"""
+        quotes = {}
+        for symbol in symbols:
+            quote = self.get_quote(symbol)
+            if quote and (quote.get('current_price') or 0) > 0:
+                quotes[symbol] = quote
+        return quotes
+
+    def get_history(self, symbols, start, end):
+        """Return daily bars between two dates keyed by symbol
+
+        Each bar is a (date, open, high, low, close, volume) tuple in
+        ascending date order. Providers without history return nothing.
+        """
+        return {}
+
+
+class YahooFinanceProvider(QuoteProvider):
+    """Quotes from the Yahoo Finance API via yfinance"""
+
+    name = 'yahoo'
+
+    def __init__(self, batch_size=QUOTE_BATCH_SIZE):
+        self.batch_size = batch_size
+
+    def get_quote(self, symbol):
+        # yfinance pulls in pandas, so it is only imported on the first fetch
+        import yfinance as yf
+
+        try:
+            logger.debug("Fetching stock info for %s", symbol)
+            stock = yf.Ticker(symbol)
+
+            # Try to get price information
+            try:
+                # First try to get price directly from ticker
+                current_price = stock.info.get('regularMarketPrice')
+                if not current_price or current_price == 0:
+                    current_price = stock.info.get('currentPrice')
+
+                # If that fails, try getting recent history
+                if not current_price or current_price == 0:
+                    hist = stock.history(period="1d")
+                    if not hist.empty and 'Close' in hist.columns:
+                        current_price = float(hist['Close'].iloc[-1])
+
+                # Default fallback
+                if not current_price or current_price == 0:
+                    logger.warning("Could not get price for %s, using default", symbol)
+                    current_price = 0.0
+
+                # Get company name
+                company_name = stock.info.get('longName')
+                if not company_name:
+                    company_name = stock.info.get('shortName', symbol.upper())
+
+                logger.debug("Retrieved %s data: %s, $%s", symbol, company_name, current_price)
+
+                return {
+                    'symbol': symbol.upper(),
+                    'company_name': company_name,
+                    'current_price': float(current_price)
+                }
+            except Exception as e:
+                logger.error("Error getting price for %s: %s", symbol, e, extra={'symbol': symbol})
+                return {
+                    'symbol': symbol.upper(),
+                    'company_name': symbol.upper() + ' Inc.',
+                    'current_price': 0.0
+                }
+
+        except Exception as e:
+            logger.error("Error fetching stock info for %s: %s", symbol, e, extra={'symbol': symbol})
+            return None
+
+    def get_quotes(self, symbols):
+        """Fetch closing prices with one bulk download per batch of symbols
+
+        Company names are not part of the bulk download, so the returned
+        quotes only carry symbol and current_price.
+        """
+        import yfinance as yf
+
+        symbols = list(symbols)
+        results = {}
+
+        for start in range(0, len(symbols), self.batch_size):
+            batch = symbols[start:start + self.batch_size]
+            try:
+                data = yf.download(batch, period="5d", group_by="column",
+                                   progress=False, threads=True)
+            except Exception as e:
+                logger.error("Error downloading quotes for %s symbols: %s", len(batch), e)
+                continue
+
+            if data is None or data.empty or 'Close' not in data:
+                continue
+
+            closes = data['Close']
+            # A single-symbol download may come back as a plain series
+            if not hasattr(closes, 'columns'):
+                closes = closes.to_frame(name=batch[0])
+
+            for symbol in batch:
+                if symbol not in closes.columns:
+                    continue
+                series = closes[symbol].dropna()
+                if series.empty or float(series.iloc[-1]) <= 0:
+                    continue
+                results[symbol] = {
+                    'symbol': symbol,
+                    'current_price': float(series.iloc[-1])
+                }
+
+        return results
+
+    def get_history(self, symbols, start, end):
+        """Download daily bars with one bulk request per batch of symbols"""
+        import yfinance as yf
+
+        symbols = list(symbols)
+        results = {}
+
+        for offset in range(0, len(symbols), self.batch_size):
+            batch = symbols[offset:offset + self.batch_size]
+            try:
+                data = yf.download(batch, start=start.isoformat(), end=(end + timedelta(days=1)).isoformat(),
+                                   interval="1d", group_by="column", auto_adjust=False,
+                                   progress=False, threads=True)
+            except Exception as e:
+                logger.error("Error downloading history for %s symbols: %s", len(batch), e)
+                continue
+
+            if data is None or data.empty or 'Close' not in data:
+                continue
+
+            fields = {}
+            for field in ('Open', 'High', 'Low', 'Close', 'Volume'):
+                frame = data[field]
+                if not hasattr(frame, 'columns'):
+                    frame = frame.to_frame(name=batch[0])
+                fields[field] = frame
+
+            for symbol in batch:
+                if symbol not in fields['Close'].columns:
+                    continue
+                bars = []
+                for ts, close in fields['Close'][symbol].items():
+                    if close != close:  # NaN
+                        continue
+                    bars.append((
+                        ts.date(),
+                        float(fields['Open'][symbol][ts]),
+                        float(fields['High'][symbol][ts]),
+                        float(fields['Low'][symbol][ts]),
+                        float(close),
+                        float(fields['Volume'][symbol][ts] or 0)
+                    ))
+                if bars:
+                    results[symbol] = bars
+
+        return results
+
+
+class LocalQuoteProvider(QuoteProvider):
+    """Offline quotes from a recorded file and/or a deterministic generator
+
+    The recorded file is a JSON object mapping symbols to objects with
+    company_name and current_price, as written by save_recording. Symbols
+    missing from the recording get a synthetic quote derived from a hash of
+    the symbol and seed when synthetic is enabled, so the same inputs always
+    produce the same prices. An optional fixed latency simulates a slow
+    upstream for benchmarks.
+    """
+
+    name = 'local'
+
+    def __init__(self, path=None, synthetic=True, seed=0, latency=0.0):
+        self.path = path
+        self.synthetic = synthetic
+        self.seed = seed
+        self.latency = latency
+        self.recorded = load_recording(path) if path else {}
+
+    def get_quote(self, symbol):
+        symbol = symbol.upper()
+        if self.latency:
+            time.sleep(self.latency)
+
+        recorded = self.recorded.get(symbol)
+        if recorded:
+            return {
+                'symbol': symbol,
+                'company_name': recorded.get('company_name') or symbol,
+                'current_price': float(recorded.get('current_price') or 0.0)
+            }
+        if self.synthetic:
+            return self.synthetic_quote(symbol)
+        return None
+
+    def get_history(self, symbols, start, end):
+        """Deterministic weekday random walk ending at each symbol's quoted price"""
+        import numpy as np
+
+        days = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+        days = days[np.is_busday(days)]
+        results = {}
+        if not len(days):
+            return results
+
+        for symbol in symbols:
+            quote = self.get_quote(symbol)
+            if not quote or not quote['current_price']:
+                continue
+            rng = np.random.default_rng(zlib.crc32(f"{self.seed}:{symbol}:history".encode()))
+            returns = rng.normal(0.0003, 0.015, len(days))
+            # Walk backwards from the current price so the last close matches it
+            log_levels = np.cumsum(returns[::-1])[::-1] - returns[-1]
+            closes = quote['current_price'] * np.exp(-log_levels)
+            opens = closes * np.exp(rng.normal(0, 0.005, len(days)))
+            highs = np.maximum(opens, closes) * (1 + np.abs(rng.normal(0, 0.004, len(days))))
+            lows = np.minimum(opens, closes) * (1 - np.abs(rng.normal(0, 0.004, len(days))))
+            volumes = rng.integers(100_000, 5_000_000, len(days))
+            results[symbol.upper()] = [
+                (day.item(), round(o, 4), round(h, 4), round(l, 4), round(c, 4), float(v))
+                for day, o, h, l, c, v in zip(days, opens, highs, lows, closes, volumes)
+            ]
+        return results
+
+    def synthetic_quote(self, symbol):
+        """Build a stable quote for a symbol from a hash of symbol and seed"""
+        digest = zlib.crc32(f"{self.seed}:{symbol}".encode())
+        return {
+            'symbol': symbol,
+            'company_name': f"{symbol} Corp.",
+            'current_price': round(5 + (digest % 49500) / 100.0, 2)
+        }
+
+
+def load_recording(path):
+    """Load a recorded quote file into a dict keyed by upper-cased symbol"""
+    with open(path) as f:
+        data = json.load(f)
+    return {symbol.upper(): quote for symbol, quote in data.items()}
+
+
+def save_recording(path, quotes):
+    """Write quotes (a dict keyed by symbol) to a file LocalQuoteProvider can replay"""
+    data = {
+        symbol: {
+            'company_name': quote.get('company_name'),
+            'current_price': quote.get('current_price')
+        }
+        for symbol, quote in quotes.items()
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+_provider = None
+
+def get_provider():
+    """Return the active quote provider, defaulting to Yahoo Finance"""
+    global _provider
+    if _provider is None:
+        _provider = YahooFinanceProvider()
+    return _provider
+
+def set_provider(provider):
+    """Replace the active quote provider, returning the previous one"""
+    global _provider
+    previous = _provider
+    _provider = provider
+    return previous
+
+def init_app(app):
+    """Configure the active provider from QUOTE_PROVIDER and related settings"""
+    app.config.setdefault('QUOTE_PROVIDER', 'yahoo')
+    app.config.setdefault('QUOTE_REPLAY_FILE', None)
+    app.config.setdefault('QUOTE_PROVIDER_SEED', 0)
+    app.config.setdefault('QUOTE_PROVIDER_LATENCY', 0.0)
+
+    name = app.config['QUOTE_PROVIDER']
+    if name == 'local':
+        provider = LocalQuoteProvider(
+            path=app.config['QUOTE_REPLAY_FILE'],
+            seed=app.config['QUOTE_PROVIDER_SEED'],
+            latency=float(app.config['QUOTE_PROVIDER_LATENCY'])
+        )
+    elif name == 'yahoo':
+        provider = YahooFinanceProvider()
+    else:
+        raise ValueError(f"Unknown quote provider: {name}")
+
+    set_provider(provider)
+    logger.info("Using quote provider: %s", provider.name)
+    return provider
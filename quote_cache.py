@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Call:
+    """An upstream fetch that concurrent callers for the same key wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class QuoteCache:
+    """Thread-safe TTL cache with LRU eviction and single-flight fetching
+
+    Concurrent misses for the same symbol are coalesced so only one caller
+    goes upstream while the others wait for its result. Only usable quotes
+    (a dict with a positive current_price) are stored.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        with self._lock:
+            return self._get_locked(key)
+
+    def put(self, key, value):
+        with self._lock:
+            self._put_locked(key, value)
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when key is None"""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def get_or_fetch(self, key, fetch):
+        """Return the cached value for key, calling fetch(key) at most once per miss"""
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.hits += 1
+                return value
+
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._in_flight[key] = call
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fetch(key)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if call.error is None and self._cacheable(call.value):
+                    self._put_locked(key, call.value)
+                self._in_flight.pop(key, None)
+            call.event.set()
+
+        return call.value
+
+    def stats(self):
+        """Return counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'hit_ratio': (self.hits / lookups) if lookups else 0.0,
+            }
+
+    @staticmethod
+    def _cacheable(value):
+        return bool(value) and (value.get('current_price') or 0) > 0
+
+    def _get_locked(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def _put_locked(self, key, value):
+        self._data[key] = (self._clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+
+_cache = QuoteCache()
+
+def get_cache():
+    """Return the process-wide quote cache"""
+    return _cache
+
+def init_app(app):
+    """Size the process-wide quote cache from QUOTE_CACHE_SIZE and QUOTE_CACHE_TTL"""
+    global _cache
+    app.config.setdefault('QUOTE_CACHE_SIZE', 1024)
+    app.config.setdefault('QUOTE_CACHE_TTL', 60.0)
+    _cache = QuoteCache(
+        maxsize=int(app.config['QUOTE_CACHE_SIZE']),
+        ttl=float(app.config['QUOTE_CACHE_TTL'])
+    )
+    return _cache
@@ -0,0 +1,195 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the concurrent fetch engine
+FETCH_MAX_WORKERS = 8
+FETCH_REQUEST_TIMEOUT = 10.0
+FETCH_DEADLINE = 60.0
+FETCH_RETRIES = 2
+FETCH_BACKOFF = 0.5
+
+# Threads shared by every fetch run in the process
+FETCH_POOL_SIZE = 16
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+class FetchStats:
+    """Latency and failure bookkeeping for one concurrent fetch run"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.failures = {}
+        self.attempts = 0
+        self.timeouts = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def record_success(self, symbol, latency):
+        with self._lock:
+            self.latencies[symbol] = latency
+
+    def record_failure(self, symbol, timed_out=False):
+        with self._lock:
+            self.failures[symbol] = self.failures.get(symbol, 0) + 1
+            if timed_out:
+                self.timeouts += 1
+
+    def summary(self):
+        """Return aggregate numbers suitable for logging or sizing the pool"""
+        latencies = sorted(self.latencies.values())
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            'succeeded': len(self.latencies),
+            'failed_symbols': len([s for s in self.failures if s not in self.latencies]),
+            'failures': sum(self.failures.values()),
+            'timeouts': self.timeouts,
+            'attempts': self.attempts,
+            'elapsed': self.elapsed,
+            'latency_p50': percentile(0.50),
+            'latency_p95': percentile(0.95),
+            'latency_max': latencies[-1] if latencies else 0.0,
+        }
+
+
+def _get_executor():
+    """Return the process-wide fetch pool, creating it on first use and again after a fork"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=FETCH_POOL_SIZE, thread_name_prefix='quote-fetch')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _is_usable(stock_info):
+    """A fetch only counts as successful if it produced a positive price"""
+    return bool(stock_info) and (stock_info.get('current_price') or 0) > 0
+
+
+def fetch_stock_infos_concurrently(symbols, fetch=None, max_workers=FETCH_MAX_WORKERS,
+                                   request_timeout=FETCH_REQUEST_TIMEOUT, deadline=FETCH_DEADLINE,
+                                   retries=FETCH_RETRIES, backoff=FETCH_BACKOFF):
+    """
+    Fetch stock info for many symbols on a bounded thread pool
+    Each attempt is abandoned after request_timeout seconds and failed
+    attempts are retried up to `retries` times with exponential backoff.
+    Whatever has completed when the overall deadline expires is returned.
+    Returns a tuple of (dict keyed by symbol, FetchStats).
+
+    Attempts run on one pool of FETCH_POOL_SIZE threads shared by every run
+    in the process, with at most max_workers of this run's in flight. An
+    abandoned attempt cannot be interrupted, so its thread stays busy until
+    the upstream call returns; the shared pool bounds how many threads hung
+    calls can hold, and a timed-out symbol is only retried once its
+    abandoned attempt has returned.
+    """
+    if fetch is None:
+        from utils import get_stock_info
+        fetch = get_stock_info
+
+    symbols = sorted({symbol.upper() for symbol in symbols if symbol})
+    results = {}
+    stats = FetchStats()
+    if not symbols:
+        return results, stats
+
+    run_started = time.monotonic()
+    run_deadline = run_started + deadline
+    started_at = {}
+
+    def attempt(symbol):
+        started_at[symbol] = time.monotonic()
+        return fetch(symbol)
+
+    # Heap of (ready_at, symbol, attempt_number) waiting to be submitted
+    queue = [(run_started, symbol, 0) for symbol in symbols]
+    heapq.heapify(queue)
+    in_flight = {}
+    # Timed-out attempts still running, whose symbol is retried once they return
+    hung = {}
+
+    def schedule_retry(symbol, attempt_number, now):
+        if attempt_number < retries:
+            delay = backoff * (2 ** attempt_number)
+            heapq.heappush(queue, (now + delay, symbol, attempt_number + 1))
+
+    executor = _get_executor()
+    try:
+        while queue or in_flight or hung:
+            now = time.monotonic()
+            if now >= run_deadline:
+                break
+
+            # Submit everything that is due, keeping at most max_workers in flight
+            while queue and queue[0][0] <= now and len(in_flight) < max_workers:
+                _, symbol, attempt_number = heapq.heappop(queue)
+                started_at.pop(symbol, None)
+                future = executor.submit(attempt, symbol)
+                in_flight[future] = (symbol, attempt_number, now)
+                stats.attempts += 1
+
+            wake_up = run_deadline
+            if queue:
+                wake_up = min(wake_up, queue[0][0])
+            for symbol, _, submitted in in_flight.values():
+                wake_up = min(wake_up, started_at.get(symbol, submitted) + request_timeout)
+
+            done, _ = wait(list(in_flight) + list(hung), timeout=max(0.0, wake_up - time.monotonic()),
+                           return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+
+            for future in done:
+                if future in hung:
+                    symbol, attempt_number = hung.pop(future)
+                    schedule_retry(symbol, attempt_number, now)
+                    continue
+                symbol, attempt_number, submitted = in_flight.pop(future)
+                latency = now - started_at.get(symbol, submitted)
+                try:
+                    stock_info = future.result()
+                except Exception as e:
+                    logger.warning("Quote fetch for %s raised: %s", symbol, e)
+                    stock_info = None
+
+                if _is_usable(stock_info):
+                    results[symbol] = stock_info
+                    stats.record_success(symbol, latency)
+                else:
+                    stats.record_failure(symbol)
+                    schedule_retry(symbol, attempt_number, now)
+
+            # Abandon attempts that have been running longer than request_timeout
+            for future, (symbol, attempt_number, submitted) in list(in_flight.items()):
+                if now - started_at.get(symbol, submitted) >= request_timeout:
+                    del in_flight[future]
+                    stats.record_failure(symbol, timed_out=True)
+                    if future.cancel():
+                        schedule_retry(symbol, attempt_number, now)
+                    elif attempt_number < retries:
+                        # Still running: retrying now would tie up a second thread on the same hung call
+                        hung[future] = (symbol, attempt_number)
+    finally:
+        # Never block on hung upstream calls; attempts not yet started are dropped
+        for future in in_flight:
+            future.cancel()
+
+    for symbol, _, _ in in_flight.values():
+        stats.record_failure(symbol, timed_out=True)
+
+    stats.elapsed = time.monotonic() - run_started
+    logger.info("Concurrent quote fetch: %s", stats.summary())
+    return results, stats
@@ -1,24 +1,41 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, make_response, Response, stream_with_context, abort, current_app
 from flask_login import login_user, logout_user, current_user, login_required
-from datetime import datetime
+from datetime import datetime, timedelta
+import io
 import logging
 import json
 
-from app import app, db
+from sqlalchemy.orm import joinedload
+from app import db
 from models import User, Stock, Portfolio, Transaction
-from forms import LoginForm, RegistrationForm, AddStockForm, SellStockForm, TransactionForm
-from utils import get_stock_info, update_stock_data, calculate_portfolio_totals, get_portfolio_data_for_chart, update_average_buy_price
+from forms import LoginForm, RegistrationForm, AddStockForm, SellStockForm, TransactionForm, ImportTransactionsForm
+import quote_cache
+from utils import get_stock_info, update_stock_data, calculate_portfolio_totals_for_users, get_stock_holdings
+from analytics import PortfolioFrame
+from accounting import record_trade, PositionError
+from performance import get_portfolio_value_series
+from snapshots import get_snapshot, refresh_snapshot
+from price_stream import price_broker
+from transaction_import import import_transactions
+from pagination import keyset_paginate
+from symbols import symbol_directory
+import transaction_export
 
-@app.route('/')
+logger = logging.getLogger(__name__)
+
+# All page and API routes; registered on the app by create_app
+bp = Blueprint('main', __name__)
+
+@bp.route('/')
 def index():
     """Homepage route"""
     return render_template('index.html', title='Home')
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     """User registration route"""
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     form = RegistrationForm()
     if form.validate_on_submit():
@@ -33,18 +50,18 @@ def register():
         try:
             db.session.commit()
             flash('Registration successful! You can now log in.', 'success')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         except Exception as e:
             db.session.rollback()
             flash(f'Error during registration: {str(e)}', 'danger')
             
     return render_template('register.html', title='Register', form=form)
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     """User login route"""
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     form = LoginForm()
     if form.validate_on_submit():
@@ -52,7 +69,7 @@ def login():
         
         if user is None or not user.check_password(form.password.data):
             flash('Invalid username or password', 'danger')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         
         login_user(user, remember=form.remember_me.data)
         flash(f'Welcome back, {user.username}!', 'success')
@@ -60,68 +77,42 @@ def login():
         # Redirect to requested page or dashboard
         next_page = request.args.get('next')
         if not next_page or not next_page.startswith('/'):
-            next_page = url_for('dashboard')
+            next_page = url_for('main.dashboard')
         return redirect(next_page)
     
     return render_template('login.html', title='Login', form=form)
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     """User logout route"""
     logout_user()
     flash('You have been logged out', 'info')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
 def dashboard():
     """User dashboard route"""
-    # Update stock prices
-    update_stock_data()
-    
-    # Get portfolio data
-    portfolio_items = Portfolio.query.filter_by(user_id=current_user.id).all()
-    totals = calculate_portfolio_totals(current_user.id)
-    
-    # Create empty arrays for chart data (using only primitive types)
-    labels = []
-    values = []
-    colors = []
-    
-    # Define colors as simple strings
-    color_list = [
-        '#4dc9f6', '#f67019', '#f53794', '#537bc4', '#acc236',
-        '#166a8f', '#00a950', '#58595b', '#8549ba', '#8b0000'
-    ]
-    
-    # Process portfolio items safely
-    if portfolio_items:
-        for i, item in enumerate(portfolio_items):
-            try:
-                # Only include items with valid data
-                if item.quantity > 0 and item.stock and item.stock.current_price:
-                    # Use only primitive types (string, float)
-                    symbol = str(item.stock.symbol)
-                    value = float(item.quantity) * float(item.stock.current_price)
-                    color = str(color_list[i % len(color_list)])
-                    
-                    # Add to our arrays
-                    labels.append(symbol)
-                    values.append(value)
-                    colors.append(color)
-            except Exception as e:
-                print(f"Error processing portfolio item {i}: {e}")
-    
-    # Pre-convert to JSON strings
+    # Prices are kept fresh by the background refresh scheduler, so only
+    # the stored Stock.current_price values are read here
+    
+    # Totals and chart data come precomputed from the user's snapshot
+    snapshot = get_snapshot(current_user.id)
+    totals = snapshot.totals
     chart_data = {
-        'has_data': len(labels) > 0,
-        'labels_json': json.dumps(labels),
-        'values_json': json.dumps(values),
-        'colors_json': json.dumps(colors)
+        'has_data': snapshot.chart_labels != '[]',
+        'labels_json': snapshot.chart_labels,
+        'values_json': snapshot.chart_values,
+        'colors_json': snapshot.chart_colors
     }
     
+    # Holding rows for the table
+    portfolio_items = PortfolioFrame.load(user_id=current_user.id).rows()
+    
     # Recent transactions
-    recent_transactions = Transaction.query.filter_by(user_id=current_user.id).order_by(Transaction.timestamp.desc()).limit(5).all()
+    recent_transactions = Transaction.query.options(joinedload(Transaction.stock)).filter_by(
+        user_id=current_user.id
+    ).order_by(Transaction.timestamp.desc(), Transaction.id.desc()).limit(5).all()
     
     return render_template(
         'dashboard.html',
@@ -132,16 +123,19 @@ def dashboard():
         recent_transactions=recent_transactions
     )
 
-@app.route('/portfolio')
+@bp.route('/portfolio_history')
+@login_required
+def portfolio_history():
+    """Daily portfolio value, cost basis and profit/loss as JSON"""
+    days = min(max(request.args.get('days', 365, type=int), 1), 3650)
+    return jsonify(get_portfolio_value_series(current_user.id, days=days))
+
+@bp.route('/portfolio')
 @login_required
 def portfolio():
     """Portfolio management route"""
-    # Update stock prices
-    update_stock_data()
-    
-    # Get portfolio data
-    portfolio_items = Portfolio.query.filter_by(user_id=current_user.id).all()
-    totals = calculate_portfolio_totals(current_user.id)
+    portfolio_items = PortfolioFrame.load(user_id=current_user.id).rows()
+    totals = get_snapshot(current_user.id).totals
     add_form = AddStockForm()
     
     return render_template(
@@ -152,7 +146,7 @@ def portfolio():
         add_form=add_form
     )
 
-@app.route('/add_stock', methods=['POST'])
+@bp.route('/add_stock', methods=['POST'])
 @login_required
 def add_stock():
     """Add a stock to portfolio"""
@@ -171,7 +165,7 @@ def add_stock():
             stock_info = get_stock_info(symbol)
             if not stock_info:
                 flash(f'Could not find stock with symbol {symbol}', 'danger')
-                return redirect(url_for('portfolio'))
+                return redirect(url_for('main.portfolio'))
             
             stock = Stock(
                 symbol=symbol,
@@ -182,33 +176,9 @@ def add_stock():
             db.session.add(stock)
             db.session.flush()  # Assign an ID without committing
         
-        # Check if user already has this stock in portfolio
-        portfolio = Portfolio.query.filter_by(user_id=current_user.id, stock_id=stock.id).first()
-        
-        if portfolio:
-            # Calculate new average price and update quantity
-            total_value = (portfolio.quantity * portfolio.average_buy_price) + (quantity * price)
-            portfolio.quantity += quantity
-            portfolio.average_buy_price = total_value / portfolio.quantity
-        else:
-            # Create new portfolio entry
-            portfolio = Portfolio(
-                user_id=current_user.id,
-                stock_id=stock.id,
-                quantity=quantity,
-                average_buy_price=price
-            )
-            db.session.add(portfolio)
-        
-        # Record the transaction
-        transaction = Transaction(
-            user_id=current_user.id,
-            stock_id=stock.id,
-            transaction_type='BUY',
-            quantity=quantity,
-            price=price
-        )
-        db.session.add(transaction)
+        # Update the position and record the transaction
+        record_trade(current_user.id, stock.id, 'BUY', quantity, price)
+        refresh_snapshot(current_user.id)
         
         try:
             db.session.commit()
@@ -217,9 +187,9 @@ def add_stock():
             db.session.rollback()
             flash(f'Error adding stock: {str(e)}', 'danger')
     
-    return redirect(url_for('portfolio'))
+    return redirect(url_for('main.portfolio'))
 
-@app.route('/sell_stock/<int:stock_id>', methods=['GET', 'POST'])
+@bp.route('/sell_stock/<int:stock_id>', methods=['GET', 'POST'])
 @login_required
 def sell_stock(stock_id):
     """Sell stock from portfolio"""
@@ -231,26 +201,12 @@ def sell_stock(stock_id):
         quantity = form.quantity.data
         price = form.price.data
         
-        if quantity > portfolio.quantity:
-            flash('You cannot sell more shares than you own', 'danger')
-            return redirect(url_for('portfolio'))
-        
-        # Update portfolio quantity
-        portfolio.quantity -= quantity
-        
-        # Record the transaction
-        transaction = Transaction(
-            user_id=current_user.id,
-            stock_id=stock.id,
-            transaction_type='SELL',
-            quantity=quantity,
-            price=price
-        )
-        db.session.add(transaction)
-        
-        # If sold all shares, remove from portfolio
-        if portfolio.quantity <= 0:
-            db.session.delete(portfolio)
+        try:
+            record_trade(current_user.id, stock.id, 'SELL', quantity, price)
+        except PositionError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('main.portfolio'))
+        refresh_snapshot(current_user.id)
             
         try:
             db.session.commit()
@@ -259,7 +215,7 @@ def sell_stock(stock_id):
             db.session.rollback()
             flash(f'Error selling stock: {str(e)}', 'danger')
             
-        return redirect(url_for('portfolio'))
+        return redirect(url_for('main.portfolio'))
     
     # Pre-fill the form with current stock price
     if stock.current_price:
@@ -273,16 +229,19 @@ def sell_stock(stock_id):
         portfolio=portfolio
     )
 
-@app.route('/transactions')
+@bp.route('/transactions')
 @login_required
 def transactions():
     """View transaction history"""
-    page = request.args.get('page', 1, type=int)
     per_page = 10
     
-    transactions = Transaction.query.filter_by(user_id=current_user.id).order_by(
-        Transaction.timestamp.desc()
-    ).paginate(page=page, per_page=per_page)
+    transactions = keyset_paginate(
+        Transaction.query.options(joinedload(Transaction.stock)).filter_by(user_id=current_user.id),
+        Transaction,
+        per_page,
+        before=request.args.get('before'),
+        after=request.args.get('after')
+    )
     
     form = TransactionForm()
     
@@ -293,43 +252,170 @@ def transactions():
         form=form
     )
 
-@app.route('/admin')
+@bp.route('/export/transactions.<fmt>')
+@login_required
+def export_transactions(fmt):
+    """
+    Stream the user's transactions as CSV or NDJSON
+    Optional start and end (YYYY-MM-DD) and symbol arguments filter the
+    rows; admins can pass all=1 to export every user's transactions.
+    """
+    if fmt not in ('csv', 'ndjson'):
+        abort(404)
+    export_all = request.args.get('all', type=int) == 1
+    if export_all and not current_user.is_admin:
+        abort(403)
+    
+    try:
+        start = transaction_export.parse_date(request.args.get('start'))
+        end = transaction_export.parse_date(request.args.get('end'))
+    except ValueError:
+        abort(400)
+    
+    statement = transaction_export.export_statement(
+        user_id=None if export_all else current_user.id,
+        start=start,
+        end=end,
+        symbol=request.args.get('symbol', '').strip()
+    )
+    rows = transaction_export.iter_transactions(statement)
+    
+    if fmt == 'csv':
+        columns = transaction_export.ADMIN_EXPORT_COLUMNS if export_all else transaction_export.EXPORT_COLUMNS
+        body, mimetype = transaction_export.generate_csv(rows, columns), 'text/csv'
+    else:
+        body, mimetype = transaction_export.generate_ndjson(rows), 'application/x-ndjson'
+    
+    # Keep the request context (and its database session) alive while streaming
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=transactions.{fmt}'
+    return response
+
+@bp.route('/admin')
 @login_required
 def admin():
     """Admin panel route"""
     if not current_user.is_admin:
         flash('You do not have permission to access the admin panel', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     users = User.query.order_by(User.username).all()
     stocks = Stock.query.order_by(Stock.symbol).all()
-    recent_transactions = Transaction.query.order_by(Transaction.timestamp.desc()).limit(20).all()
+    
+    # Per-user and per-stock breakdowns are aggregated in SQL, one query each
+    user_totals = calculate_portfolio_totals_for_users([user.id for user in users])
+    stock_holdings = get_stock_holdings()
+    recent_transactions = Transaction.query.options(
+        joinedload(Transaction.stock), joinedload(Transaction.user)
+    ).order_by(Transaction.timestamp.desc(), Transaction.id.desc()).limit(20).all()
     
     return render_template(
         'admin.html',
         title='Admin Panel',
         users=users,
+        user_totals=user_totals,
+        stock_holdings=stock_holdings,
         stocks=stocks,
         transactions=recent_transactions
     )
 
-@app.route('/admin/update_stocks')
+@bp.route('/admin/update_stocks')
 @login_required
 def admin_update_stocks():
     """Update all stock prices (admin only)"""
     if not current_user.is_admin:
         flash('You do not have permission to perform this action', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     try:
-        update_stock_data()
-        flash('Stock prices updated successfully', 'success')
+        # Force a refresh of every tracked stock in bulk batches
+        update_count = update_stock_data(max_age=timedelta(0))
+        flash(f'Stock prices updated successfully ({update_count} updated)', 'success')
     except Exception as e:
         flash(f'Error updating stock prices: {str(e)}', 'danger')
     
-    return redirect(url_for('admin'))
+    return redirect(url_for('main.admin'))
+
+@bp.route('/admin/quote_cache')
+@login_required
+def admin_quote_cache():
+    """Quote cache hit/miss counters for monitoring (admin only)"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    return jsonify(quote_cache.get_cache().stats())
+
+def _snapshot_etag(snapshot):
+    """ETag that changes whenever a trade or price update changes the user's snapshot values"""
+    return f'{snapshot.user_id}-{int(snapshot.updated_at.timestamp() * 1000000)}'
+
+def _conditional_json(build):
+    """
+    Return build(snapshot) as JSON with an ETag, or an empty 304 response
+    when the client's If-None-Match already matches the current snapshot
+    """
+    snapshot = get_snapshot(current_user.id)
+    etag = _snapshot_etag(snapshot)
+    
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        response = jsonify(build(snapshot))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@bp.route('/api/portfolio')
+@login_required
+def api_portfolio():
+    """JSON list of the user's positions"""
+    return _conditional_json(lambda snapshot: {
+        'positions': [row._asdict() for row in PortfolioFrame.load(user_id=current_user.id).rows()]
+    })
+
+@bp.route('/api/totals')
+@login_required
+def api_totals():
+    """JSON portfolio totals"""
+    return _conditional_json(lambda snapshot: snapshot.totals)
+
+@bp.route('/api/chart')
+@login_required
+def api_chart():
+    """JSON allocation chart series"""
+    return _conditional_json(lambda snapshot: {
+        'labels': json.loads(snapshot.chart_labels),
+        'values': json.loads(snapshot.chart_values),
+        'colors': json.loads(snapshot.chart_colors)
+    })
+
+@bp.route('/stream/prices')
+@login_required
+def stream_prices():
+    """Server-Sent Events stream of price changes for the stocks the user holds"""
+    if not current_app.config['PRICE_STREAM_ENABLED']:
+        # 204 tells EventSource not to reconnect
+        return '', 204
+    
+    holdings = db.session.query(Stock.id, Stock.symbol, Stock.current_price).join(
+        Portfolio, Portfolio.stock_id == Stock.id
+    ).filter(Portfolio.user_id == current_user.id).all()
+    # EventSource resends the last event id on reconnect so nothing is missed
+    last_event_id = request.headers.get('Last-Event-ID')
+    since = price_broker.parse_event_id(last_event_id)
+    initial = None
+    if last_event_id and since is None:
+        # Issued by another worker or before a restart: resend current prices
+        initial = {symbol: price for _, symbol, price in holdings if price}
+    
+    stream = price_broker.stream([stock_id for stock_id, _, _ in holdings], since=since, initial=initial,
+                                 max_duration=current_app.config['PRICE_STREAM_MAX_DURATION'])
+    response = Response(stream, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
-@app.route('/search_stock')
+@bp.route('/search_stock')
 @login_required
 def search_stock():
     """API endpoint to search for stock information"""
@@ -345,7 +431,15 @@ def search_stock():
     
     return jsonify(stock_info)
 
-@app.route('/record_transaction', methods=['GET', 'POST'])
+@bp.route('/autocomplete')
+@login_required
+def autocomplete():
+    """Ranked symbol suggestions by ticker prefix or company name, from the local directory"""
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', 10, type=int)
+    return jsonify(symbol_directory.search(query, limit=limit))
+
+@bp.route('/record_transaction', methods=['GET', 'POST'])
 @login_required
 def record_transaction():
     """Record a manual transaction"""
@@ -365,7 +459,7 @@ def record_transaction():
             stock_info = get_stock_info(symbol)
             if not stock_info:
                 flash(f'Could not find stock with symbol {symbol}', 'danger')
-                return redirect(url_for('transactions'))
+                return redirect(url_for('main.transactions'))
             
             stock = Stock(
                 symbol=symbol,
@@ -376,46 +470,14 @@ def record_transaction():
             db.session.add(stock)
             db.session.flush()  # Assign an ID without committing
         
-        # Record the transaction
-        transaction = Transaction(
-            user_id=current_user.id,
-            stock_id=stock.id,
-            transaction_type=transaction_type,
-            quantity=quantity,
-            price=price
-        )
-        db.session.add(transaction)
-        
-        # Update portfolio based on transaction type
-        portfolio = Portfolio.query.filter_by(user_id=current_user.id, stock_id=stock.id).first()
-        
-        if transaction_type == 'BUY':
-            if portfolio:
-                # Calculate new average price and update quantity for BUY
-                total_value = (portfolio.quantity * portfolio.average_buy_price) + (quantity * price)
-                portfolio.quantity += quantity
-                portfolio.average_buy_price = total_value / portfolio.quantity
-            else:
-                # Create new portfolio entry
-                portfolio = Portfolio(
-                    user_id=current_user.id,
-                    stock_id=stock.id,
-                    quantity=quantity,
-                    average_buy_price=price
-                )
-                db.session.add(portfolio)
-        else:  # SELL
-            if not portfolio or portfolio.quantity < quantity:
-                flash('You cannot sell more shares than you own', 'danger')
-                db.session.rollback()
-                return redirect(url_for('transactions'))
-            
-            # Update portfolio quantity
-            portfolio.quantity -= quantity
-            
-            # If sold all shares, remove from portfolio
-            if portfolio.quantity <= 0:
-                db.session.delete(portfolio)
+        # Record the transaction and update the position
+        try:
+            record_trade(current_user.id, stock.id, transaction_type, quantity, price)
+        except PositionError as e:
+            flash(str(e), 'danger')
+            db.session.rollback()
+            return redirect(url_for('main.transactions'))
+        refresh_snapshot(current_user.id)
         
         try:
             db.session.commit()
@@ -424,7 +486,7 @@ def record_transaction():
             db.session.rollback()
             flash(f'Error recording transaction: {str(e)}', 'danger')
             
-        return redirect(url_for('transactions'))
+        return redirect(url_for('main.transactions'))
     
     return render_template(
         'record_transaction.html',
@@ -432,7 +494,36 @@ def record_transaction():
         form=form
     )
 
-@app.route('/sell_stock.html')
+@bp.route('/import_transactions', methods=['GET', 'POST'])
+@login_required
+def import_transactions_view():
+    """Import transactions in bulk from an uploaded CSV file"""
+    form = ImportTransactionsForm()
+    result = None
+    
+    if form.validate_on_submit():
+        # Read the upload as a text stream so large files are never held as one string
+        lines = io.TextIOWrapper(form.file.data.stream, encoding='utf-8-sig', newline='')
+        try:
+            result = import_transactions(current_user.id, lines)
+            db.session.commit()
+            flash(f'Import finished: {result.summary()}', 'success' if not result.skipped else 'warning')
+        except (ValueError, UnicodeDecodeError) as e:
+            db.session.rollback()
+            flash(f'Could not import file: {str(e)}', 'danger')
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error importing transactions: %s", e)
+            flash(f'Error importing transactions: {str(e)}', 'danger')
+    
+    return render_template(
+        'import_transactions.html',
+        title='Import Transactions',
+        form=form,
+        result=result
+    )
+
+@bp.route('/sell_stock.html')
 @login_required
 def sell_stock_template():
     """Route for the sell stock template (will be loaded via AJAX)"""
@@ -0,0 +1,96 @@
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class PriceRefreshScheduler:
+    """Background worker that keeps stored stock prices fresh.
+
+    Request handlers only read ``Stock.current_price``; this scheduler owns
+    every upstream price update and runs them on a fixed cadence in a daemon
+    thread, so page latency no longer depends on the number of tracked
+    symbols or on the quote provider's speed. Each run also backfills the
+    daily history of traded stocks that have none yet.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        # Stocks already backfilled by this process, so bars that do not exist are not refetched
+        self._backfilled = set()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read scheduler settings from the app config and register the extension"""
+        app.config.setdefault('PRICE_REFRESH_ENABLED', True)
+        app.config.setdefault('PRICE_REFRESH_INTERVAL', 900)
+        self.app = app
+        self.interval = int(app.config['PRICE_REFRESH_INTERVAL'])
+        app.extensions['price_refresh_scheduler'] = self
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the refresh thread if it is enabled and not already running"""
+        if not self.app.config['PRICE_REFRESH_ENABLED'] or self.running:
+            return False
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='price-refresh', daemon=True)
+        self._thread.start()
+        logger.info("Price refresh scheduler started (every %ss)", self.interval)
+        return True
+
+    def stop(self, timeout=None):
+        """Ask the refresh thread to exit and wait for it"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self):
+        """Refresh every stock whose price is older than the refresh interval, then backfill missing history"""
+        from price_history import backfill_missing_history
+        from utils import update_stock_data
+        from shared_cache import get_shared_cache
+
+        # With several worker processes only the lease holder goes upstream
+        shared = get_shared_cache()
+        if shared is not None and not shared.acquire_lease('price-refresh', self.owner, self.interval):
+            return
+
+        with self.app.app_context():
+            try:
+                update_stock_data(max_age=timedelta(seconds=self.interval))
+            except Exception as e:
+                logger.error("Scheduled price refresh failed: %s", e)
+            try:
+                self._backfilled.update(backfill_missing_history(skip=self._backfilled))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error("Scheduled history backfill failed: %s", e)
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        # Refresh immediately on start, then once per interval until stopped;
+        # one failed run must not end the thread
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Scheduled price refresh run failed")
+            self._stop_event.wait(self.interval)
@@ -0,0 +1,172 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class SharedQuoteCache:
+    """Quote cache in a local SQLite file shared by every worker process
+
+    The file uses WAL journaling so readers in all workers proceed while one
+    worker writes. Each quote carries an ``updated_at`` UTC stamp in the same
+    naive-UTC form as ``Stock.last_updated``, so freshness can be compared
+    directly with stored stocks. A small lease table lets workers agree on
+    which one performs the periodic upstream refresh.
+
+    Nothing is opened in the constructor. Each thread opens its own
+    connection on first use, and the connection is tagged with the process
+    id, so a worker forked after create_app (e.g. gunicorn --preload) never
+    reuses a connection inherited from its parent.
+    """
+
+    def __init__(self, path, ttl=60.0):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        # Connections inherited across fork, kept referenced so they are never closed here
+        self._inherited = []
+
+    def _connect(self):
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            inherited = getattr(self._local, 'conn', None)
+            if inherited is not None:
+                self._inherited.append(inherited)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._create_schema(conn)
+            self._local.conn = conn
+            self._local.pid = pid
+        return self._local.conn
+
+    def _create_schema(self, conn):
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS quote ('
+            ' symbol TEXT PRIMARY KEY,'
+            ' company_name TEXT,'
+            ' current_price REAL NOT NULL,'
+            ' updated_at TEXT NOT NULL)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS lease ('
+            ' name TEXT PRIMARY KEY,'
+            ' owner TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL)'
+        )
+
+    def get(self, symbol, max_age=None):
+        """Return a full quote (including company name) fresher than max_age, or None"""
+        quote = self.get_many([symbol], max_age).get(symbol.upper())
+        if not quote or not quote.get('company_name'):
+            return None
+        return {
+            'symbol': quote['symbol'],
+            'company_name': quote['company_name'],
+            'current_price': quote['current_price']
+        }
+
+    def get_many(self, symbols, max_age=None):
+        """Return quotes fresher than max_age keyed by symbol, each with a last_updated stamp"""
+        symbols = [symbol.upper() for symbol in symbols]
+        if not symbols:
+            return {}
+        if max_age is None:
+            max_age = timedelta(seconds=self.ttl)
+        cutoff = (datetime.utcnow() - max_age).isoformat()
+
+        results = {}
+        conn = self._connect()
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(symbols), 500):
+            batch = symbols[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            rows = conn.execute(
+                f'SELECT symbol, company_name, current_price, updated_at FROM quote '
+                f'WHERE symbol IN ({placeholders}) AND updated_at > ?',
+                batch + [cutoff]
+            ).fetchall()
+            for symbol, company_name, current_price, updated_at in rows:
+                results[symbol] = {
+                    'symbol': symbol,
+                    'company_name': company_name,
+                    'current_price': current_price,
+                    'last_updated': datetime.fromisoformat(updated_at)
+                }
+        return results
+
+    def put(self, quote, updated_at=None):
+        self.put_many({quote['symbol']: quote}, updated_at)
+
+    def put_many(self, quotes, updated_at=None):
+        """Store quotes keyed by symbol; a missing company name keeps the stored one"""
+        stamp = (updated_at or datetime.utcnow()).isoformat()
+        rows = [
+            (symbol.upper(), quote.get('company_name'), float(quote['current_price']), stamp)
+            for symbol, quote in quotes.items()
+            if (quote.get('current_price') or 0) > 0
+        ]
+        if not rows:
+            return
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                'INSERT INTO quote (symbol, company_name, current_price, updated_at) '
+                'VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(symbol) DO UPDATE SET '
+                ' company_name = COALESCE(excluded.company_name, quote.company_name),'
+                ' current_price = excluded.current_price,'
+                ' updated_at = excluded.updated_at',
+                rows
+            )
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            # A busy BEGIN IMMEDIATE leaves no transaction to roll back
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            logger.error("Error writing shared quote cache: %s", e)
+
+    def acquire_lease(self, name, owner, duration):
+        """Take or renew a named lease for duration seconds; True if owner now holds it"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT owner, expires_at FROM lease WHERE name = ?', (name,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                conn.execute('COMMIT')
+                return False
+            conn.execute(
+                'INSERT OR REPLACE INTO lease (name, owner, expires_at) VALUES (?, ?, ?)',
+                (name, owner, now + duration)
+            )
+            conn.execute('COMMIT')
+            return True
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            logger.error("Error acquiring lease %s: %s", name, e)
+            return False
+
+
+_shared_cache = None
+
+def get_shared_cache():
+    """Return the shared quote cache, or None when it is not configured"""
+    return _shared_cache
+
+def init_app(app):
+    """Open the shared cache at QUOTE_SHARED_CACHE_PATH if one is configured"""
+    global _shared_cache
+    app.config.setdefault('QUOTE_SHARED_CACHE_PATH', None)
+    app.config.setdefault('QUOTE_CACHE_TTL', 60.0)
+
+    path = app.config['QUOTE_SHARED_CACHE_PATH']
+    _shared_cache = SharedQuoteCache(path, ttl=float(app.config['QUOTE_CACHE_TTL'])) if path else None
+    return _shared_cache
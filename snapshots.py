@@ -0,0 +1,118 @@
+import json
+import math
+from datetime import datetime
+
+from app import db
+from models import Portfolio, PortfolioSnapshot, User
+from analytics import PortfolioFrame
+
+
+def _fill_snapshot(snapshot, frame):
+    """Store a frame's totals and chart data; updated_at only moves when a value changed"""
+    totals = frame.totals()
+    allocation = frame.allocation()
+    values = {
+        'total_current_value': totals['total_current_value'],
+        'total_investment': totals['total_investment'],
+        'total_profit_loss': totals['total_profit_loss'],
+        'profit_loss_percentage': totals['profit_loss_percentage'],
+        'chart_labels': json.dumps(allocation['labels']),
+        'chart_values': json.dumps(allocation['values']),
+        'chart_colors': json.dumps(allocation['colors']),
+    }
+    # Scheduled refreshes mostly find nothing moved; keep the ETag (and the row) as they are
+    if snapshot.updated_at is None or any(getattr(snapshot, field) != value for field, value in values.items()):
+        for field, value in values.items():
+            setattr(snapshot, field, value)
+        snapshot.updated_at = datetime.utcnow()
+    return snapshot
+
+
+def refresh_snapshots(user_ids):
+    """
+    Recompute the snapshots of the given users from their positions
+    Loads every position in one query. Pending position changes in the
+    session are flushed first, so calling this before commit stores the
+    snapshot in the same transaction. Does not commit.
+    """
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return []
+    frame = PortfolioFrame.load(user_ids=user_ids)
+    existing = {
+        snapshot.user_id: snapshot
+        for snapshot in PortfolioSnapshot.query.filter(PortfolioSnapshot.user_id.in_(user_ids)).all()
+    }
+
+    snapshots = []
+    for user_id in user_ids:
+        snapshot = existing.get(user_id)
+        if snapshot is None:
+            snapshot = PortfolioSnapshot(user_id=user_id)
+            db.session.add(snapshot)
+        snapshots.append(_fill_snapshot(snapshot, frame.for_user(user_id)))
+    return snapshots
+
+
+def refresh_snapshot(user_id):
+    """Recompute one user's snapshot; does not commit"""
+    return refresh_snapshots([user_id])[0]
+
+
+def refresh_snapshots_for_stocks(stock_ids):
+    """Recompute the snapshots of every user holding one of the given stocks"""
+    stock_ids = list(stock_ids)
+    if not stock_ids:
+        return []
+    user_ids = [row[0] for row in db.session.query(Portfolio.user_id).filter(
+        Portfolio.stock_id.in_(stock_ids)
+    ).distinct()]
+    return refresh_snapshots(user_ids)
+
+
+def get_snapshot(user_id):
+    """Return a user's snapshot with a single-row lookup, building it if missing"""
+    snapshot = db.session.get(PortfolioSnapshot, user_id)
+    if snapshot is None:
+        snapshot = refresh_snapshot(user_id)
+        db.session.commit()
+    return snapshot
+
+
+def check_snapshot(user_id, tolerance=1e-6):
+    """
+    Compare a user's stored snapshot with a full recomputation
+    Returns a list of (field, stored, expected) differences; empty when
+    the snapshot is consistent.
+    """
+    stored = db.session.get(PortfolioSnapshot, user_id)
+    expected = _fill_snapshot(PortfolioSnapshot(user_id=user_id), PortfolioFrame.load(user_id=user_id))
+    if stored is None:
+        return [('snapshot', None, 'missing')]
+
+    differences = []
+    for field in ('total_current_value', 'total_investment', 'total_profit_loss', 'profit_loss_percentage'):
+        stored_value, expected_value = getattr(stored, field), getattr(expected, field)
+        if not math.isclose(stored_value, expected_value, rel_tol=tolerance, abs_tol=tolerance):
+            differences.append((field, stored_value, expected_value))
+    for field in ('chart_labels', 'chart_colors'):
+        if json.loads(getattr(stored, field)) != json.loads(getattr(expected, field)):
+            differences.append((field, getattr(stored, field), getattr(expected, field)))
+    stored_values, expected_values = json.loads(stored.chart_values), json.loads(expected.chart_values)
+    if len(stored_values) != len(expected_values) or not all(
+        math.isclose(a, b, rel_tol=tolerance, abs_tol=tolerance) for a, b in zip(stored_values, expected_values)
+    ):
+        differences.append(('chart_values', stored.chart_values, expected.chart_values))
+    return differences
+
+
+def check_snapshots(repair=False):
+    """Check every user's snapshot; returns {user_id: differences} for inconsistent ones"""
+    problems = {}
+    for (user_id,) in db.session.query(User.id).order_by(User.id):
+        differences = check_snapshot(user_id)
+        if differences:
+            problems[user_id] = differences
+    if repair and problems:
+        refresh_snapshots(problems)
+    return problems
@@ -157,3 +157,52 @@ function createStockPerformanceBarChart(elementId, labels, returns) {
         }
     });
 }
+
+/**
+ * Returns a function that reloads a chart's data from a JSON endpoint in place
+ * Sends the last ETag in If-None-Match so unchanged data costs a 304
+ * @param {Chart} chart - The Chart instance to update
+ * @param {string} url - Endpoint returning {labels, values, colors}
+ * @returns {Function} Call to refresh the chart
+ */
+function createChartRefresher(chart, url) {
+    let etag = null;
+    
+    return function() {
+        const headers = etag ? { 'If-None-Match': etag } : {};
+        
+        return fetch(url, { headers: headers, cache: 'no-store' })
+            .then(response => {
+                if (response.status === 304 || !response.ok) {
+                    return null;
+                }
+                etag = response.headers.get('ETag');
+                return response.json();
+            })
+            .then(data => {
+                if (!data) {
+                    return;
+                }
+                chart.data.labels = data.labels;
+                chart.data.datasets[0].data = data.values;
+                if (data.colors) {
+                    chart.data.datasets[0].backgroundColor = data.colors;
+                }
+                chart.update();
+            })
+            .catch(error => console.error('Error refreshing chart:', error));
+    };
+}
+
+/**
+ * Polls a JSON chart endpoint and updates a chart in place when it changes
+ * @param {Chart} chart - The Chart instance to update
+ * @param {string} url - Endpoint returning {labels, values, colors}
+ * @param {number} intervalMs - Polling interval in milliseconds
+ * @returns {Function} Call to refresh the chart immediately
+ */
+function pollChartData(chart, url, intervalMs) {
+    const refresh = createChartRefresher(chart, url);
+    setInterval(refresh, intervalMs);
+    return refresh;
+}
@@ -6,6 +6,7 @@
 document.addEventListener('DOMContentLoaded', function() {
     // Stock symbols autocomplete and validation
     setupStockSymbolSearch();
+    setupSymbolAutocomplete();
     
     // Quick sell button functionality
     setupSellModalTriggers();
@@ -64,6 +65,61 @@ function setupStockSymbolSearch() {
     });
 }
 
+/**
+ * Attaches ticker and company name suggestions to symbol inputs
+ * Inputs marked with data-symbol-autocomplete get a datalist filled from
+ * the /autocomplete endpoint as the user types
+ */
+function setupSymbolAutocomplete() {
+    const inputs = document.querySelectorAll('input[data-symbol-autocomplete]');
+    // Responses by query, so retyping or backspacing does not refetch
+    const cache = new Map();
+    
+    inputs.forEach(input => {
+        const datalist = document.createElement('datalist');
+        datalist.id = `${input.id || 'symbol'}-suggestions`;
+        input.setAttribute('list', datalist.id);
+        input.insertAdjacentElement('afterend', datalist);
+        
+        const showSuggestions = function(suggestions) {
+            datalist.innerHTML = '';
+            suggestions.forEach(item => {
+                const option = document.createElement('option');
+                option.value = item.symbol;
+                option.label = item.exchange ? `${item.company_name} (${item.exchange})` : item.company_name;
+                datalist.appendChild(option);
+            });
+        };
+        
+        let timer = null;
+        input.addEventListener('input', function() {
+            const query = input.value.trim();
+            clearTimeout(timer);
+            if (!query) {
+                showSuggestions([]);
+                return;
+            }
+            if (cache.has(query)) {
+                showSuggestions(cache.get(query));
+                return;
+            }
+            
+            // Wait for a pause in typing before asking the server
+            timer = setTimeout(function() {
+                fetch(`/autocomplete?q=${encodeURIComponent(query)}`)
+                    .then(response => response.json())
+                    .then(suggestions => {
+                        cache.set(query, suggestions);
+                        if (input.value.trim() === query) {
+                            showSuggestions(suggestions);
+                        }
+                    })
+                    .catch(error => console.error('Error loading symbol suggestions:', error));
+            }, 150);
+        });
+    });
+}
+
 /**
  * Sets up sell button event listeners
  */
@@ -162,3 +218,104 @@ function calculateFormTotals() {
         }
     });
 }
+
+/**
+ * Subscribes to the live price stream for the user's holdings
+ * EventSource reconnects on its own and resumes from the last event id
+ * @param {string} url - The price stream endpoint
+ * @param {Function} onPrices - Called with an object mapping symbols to prices
+ * @returns {EventSource} The open stream, or null if unsupported
+ */
+function subscribeToPrices(url, onPrices) {
+    if (!window.EventSource) {
+        return null;
+    }
+    
+    const source = new EventSource(url);
+    source.addEventListener('prices', function(event) {
+        try {
+            onPrices(JSON.parse(event.data).prices);
+        } catch (error) {
+            console.error('Error handling price update:', error);
+        }
+    });
+    return source;
+}
+
+/**
+ * Polls the positions endpoint for prices when the live stream is disabled
+ * Unchanged portfolios answer 304 through the ETag, so polls are cheap
+ * @param {string} url - The /api/portfolio endpoint
+ * @param {Function} onPrices - Called with an object mapping symbols to prices
+ * @param {number} intervalMs - Polling interval in milliseconds
+ */
+function pollPrices(url, onPrices, intervalMs) {
+    let etag = null;
+    
+    setInterval(function() {
+        const headers = etag ? { 'If-None-Match': etag } : {};
+        
+        fetch(url, { headers: headers, cache: 'no-store' })
+            .then(response => {
+                if (response.status === 304 || !response.ok) {
+                    return null;
+                }
+                etag = response.headers.get('ETag');
+                return response.json();
+            })
+            .then(data => {
+                if (!data) {
+                    return;
+                }
+                const prices = {};
+                data.positions.forEach(position => {
+                    prices[position.symbol] = position.current_price;
+                });
+                onPrices(prices);
+            })
+            .catch(error => console.error('Error polling prices:', error));
+    }, intervalMs);
+}
+
+/**
+ * Updates holding rows in place from new prices
+ * Rows carry data-symbol, data-quantity and data-average-price attributes;
+ * cells to refresh are marked with the live-* classes
+ * @param {Object} prices - Mapping of symbols to current prices
+ */
+function updatePositionRows(prices) {
+    // Same sign formatting as the server-rendered cells
+    const formatSigned = function(value, prefix, suffix) {
+        return (value >= 0 ? '+' : '') + prefix + value.toFixed(2) + suffix;
+    };
+    const setSign = function(cell, value) {
+        cell.classList.toggle('text-success', value >= 0);
+        cell.classList.toggle('text-danger', value < 0);
+    };
+    
+    document.querySelectorAll('tr[data-symbol]').forEach(row => {
+        const price = prices[row.dataset.symbol];
+        if (price === undefined) {
+            return;
+        }
+        
+        const quantity = parseFloat(row.dataset.quantity) || 0;
+        const averagePrice = parseFloat(row.dataset.averagePrice) || 0;
+        const currentValue = quantity * price;
+        const investment = quantity * averagePrice;
+        // P/L only counts when both prices are known, as on the server
+        const profitLoss = averagePrice ? currentValue - investment : 0;
+        const profitLossPercentage = investment > 0 ? profitLoss / investment * 100 : 0;
+        
+        row.querySelector('.live-price').textContent = `$${price.toFixed(2)}`;
+        row.querySelector('.live-value').textContent = `$${currentValue.toFixed(2)}`;
+        
+        const profitLossCell = row.querySelector('.live-profit-loss');
+        profitLossCell.textContent = formatSigned(profitLoss, '$', '');
+        setSign(profitLossCell, profitLoss);
+        
+        const returnCell = row.querySelector('.live-return');
+        returnCell.textContent = formatSigned(profitLossPercentage, '', '%');
+        setSign(returnCell, profitLossPercentage);
+    });
+}
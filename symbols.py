@@ -0,0 +1,201 @@
+import bisect
+import csv
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Directory bundled with the app; SYMBOL_DIRECTORY_FILE points at a larger one
+DEFAULT_SYMBOL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'symbols.csv')
+
+# Upper bound on matches returned by search
+MAX_RESULTS = 50
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SymbolDirectory:
+    """In-memory ticker and company name index for autocomplete
+
+    Tickers are kept in sorted lists, one per ticker length, so a prefix
+    lookup is a couple of bisects per length. Company names are indexed by
+    word prefix (sorted list of words) and by trigram for substring
+    matches; a substring lookup scans only the shortest posting list among
+    the query's trigrams, confirming each candidate, and every stage stops
+    as soon as enough matches are found.
+
+    Results are ranked: exact ticker, ticker prefix (shorter tickers first),
+    company name word prefix, then any other company name substring.
+    """
+
+    def __init__(self, entries=()):
+        # (symbol, company_name, exchange) tuples
+        self.entries = []
+        self._tickers = []
+        self._tickers_by_length = {}
+        self._names = []
+        self._words = []
+        self._trigram_index = {}
+        self._ready = threading.Event()
+        if entries:
+            self.build(entries)
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def build(self, entries):
+        """Index (symbol, company_name, exchange) rows, replacing any previous contents"""
+        unique = {}
+        for symbol, company_name, exchange in entries:
+            symbol = symbol.strip().upper()
+            if symbol:
+                unique[symbol] = (symbol, (company_name or symbol).strip(), (exchange or '').strip())
+        entries = sorted(unique.values())
+
+        tickers = [entry[0] for entry in entries]
+        tickers_by_length = {}
+        names = []
+        words = []
+        trigram_index = {}
+        for index, (symbol, company_name, _) in enumerate(entries):
+            # Tickers arrive sorted, so each per-length list stays sorted
+            tickers_by_length.setdefault(len(symbol), ([], []))
+            tickers_by_length[len(symbol)][0].append(symbol)
+            tickers_by_length[len(symbol)][1].append(index)
+            name = company_name.lower()
+            names.append(name)
+            for word in set(name.replace(',', ' ').split()):
+                words.append((word, index))
+            for trigram in _trigrams(name):
+                trigram_index.setdefault(trigram, []).append(index)
+        words.sort()
+
+        # Swap in the finished index in one step so searches never see a partial build
+        (self.entries, self._tickers, self._tickers_by_length, self._names, self._words,
+         self._trigram_index) = (entries, tickers, sorted(tickers_by_length.items()), names, words, trigram_index)
+        self._ready.set()
+        return len(entries)
+
+    def get(self, symbol):
+        """Return the entry for an exact ticker, or None"""
+        symbol = symbol.strip().upper()
+        index = bisect.bisect_left(self._tickers, symbol)
+        if index < len(self._tickers) and self._tickers[index] == symbol:
+            return self.entries[index]
+        return None
+
+    def search(self, query, limit=10, timeout=5.0):
+        """Return ranked entry dicts matching a ticker prefix or company name substring"""
+        query = query.strip()
+        if not query:
+            return []
+        if not self._ready.wait(timeout):
+            return []
+        limit = max(1, min(limit, MAX_RESULTS))
+
+        seen = set()
+        matches = []
+
+        def add(indexes):
+            for index in indexes:
+                if index not in seen:
+                    seen.add(index)
+                    matches.append(index)
+                    if len(matches) >= limit:
+                        return True
+            return False
+
+        # Ticker prefix, shorter tickers (so an exact match) first
+        upper = query.upper()
+        for length, (tickers, indexes) in self._tickers_by_length:
+            if length < len(upper):
+                continue
+            start = bisect.bisect_left(tickers, upper)
+            end = bisect.bisect_left(tickers, upper + '\uffff')
+            if add(indexes[i] for i in range(start, end)):
+                return self._results(matches)
+
+        # Company name word prefix
+        lower = query.lower()
+        start = bisect.bisect_left(self._words, (lower,))
+        end = bisect.bisect_left(self._words, (lower + '\uffff',))
+        words = self._words
+        if add(words[i][1] for i in range(start, end)):
+            return self._results(matches)
+
+        # Company name substring, confirmed along the rarest trigram's postings
+        if len(lower) >= 3:
+            postings = min((self._trigram_index.get(t, ()) for t in _trigrams(lower)), key=len)
+            names = self._names
+            add(index for index in postings if lower in names[index])
+
+        return self._results(matches)
+
+    def _results(self, indexes):
+        return [
+            {'symbol': symbol, 'company_name': company_name, 'exchange': exchange}
+            for symbol, company_name, exchange in (self.entries[i] for i in indexes)
+        ]
+
+
+symbol_directory = SymbolDirectory()
+
+
+def read_symbol_file(path):
+    """Read (symbol, company_name, exchange) rows from a CSV file with those columns"""
+    with open(path, newline='', encoding='utf-8') as f:
+        return [
+            (row.get('symbol') or '', row.get('company_name'), row.get('exchange'))
+            for row in csv.DictReader(f)
+        ]
+
+
+def load_symbol_directory(app):
+    """Load the directory file plus every stock already tracked in the database"""
+    from app import db
+    from models import Stock
+
+    started = time.perf_counter()
+    path = app.config['SYMBOL_DIRECTORY_FILE']
+    entries = []
+    try:
+        entries = read_symbol_file(path)
+    except OSError as e:
+        logger.error("Could not read symbol directory %s: %s", path, e)
+
+    with app.app_context():
+        try:
+            known = {entry[0].strip().upper() for entry in entries}
+            entries.extend(
+                (symbol, company_name, '')
+                for symbol, company_name in db.session.query(Stock.symbol, Stock.company_name)
+                if symbol.upper() not in known
+            )
+        except Exception as e:
+            # e.g. before `flask init-db` has created the tables
+            logger.error("Could not load tracked stocks into the symbol directory: %s", e)
+        finally:
+            db.session.remove()
+
+    count = symbol_directory.build(entries)
+    elapsed = time.perf_counter() - started
+    logger.info("Symbol directory loaded %s symbols in %.3fs", count, elapsed,
+                extra={'symbols': count, 'seconds': round(elapsed, 3)})
+    return count
+
+
+def init_app(app):
+    """Configure the symbol directory; start_loader fills it once the app serves requests"""
+    app.config.setdefault('SYMBOL_DIRECTORY_FILE', DEFAULT_SYMBOL_FILE)
+    return symbol_directory
+
+def start_loader(app):
+    """Warm the symbol directory on a background thread so the first requests are not delayed"""
+    thread = threading.Thread(target=load_symbol_directory, args=(app,), name='symbol-directory', daemon=True)
+    thread.start()
+    return thread
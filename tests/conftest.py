@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app():
+    """App on a fresh SQLite file with offline quotes and no background refresh"""
+    from app import create_app, db, init_db
+
+    path = os.path.join(tempfile.mkdtemp(), 'test.db')
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'WTF_CSRF_ENABLED': False,
+        'PRICE_REFRESH_ENABLED': False,
+        'QUOTE_PROVIDER': 'local',
+        'PROFILING_ENABLED': False,
+        'LOG_LEVEL': 'WARNING',
+    })
+    with app.app_context():
+        init_db()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
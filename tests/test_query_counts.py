@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from models import User, Stock, Portfolio, Transaction
+from snapshots import refresh_snapshot
+
+
+def seed_user(positions):
+    """Create a user holding the given number of positions; returns the user id"""
+    user = User(username=f'holder{positions}', email=f'holder{positions}@example.com', password_hash='-')
+    db.session.add(user)
+    db.session.flush()
+    for i in range(positions):
+        stock = Stock(symbol=f'Q{positions}X{i}', company_name=f'Stock {i}', current_price=10.0 + i)
+        db.session.add(stock)
+        db.session.flush()
+        db.session.add(Portfolio(user_id=user.id, stock_id=stock.id, quantity=5.0, average_buy_price=8.0))
+        db.session.add(Transaction(user_id=user.id, stock_id=stock.id, transaction_type='BUY',
+                                   quantity=5.0, price=8.0))
+    refresh_snapshot(user.id)
+    db.session.commit()
+    return user.id
+
+
+def count_queries(client, path):
+    """Number of SQL statements this thread executes while serving path"""
+    thread_id = threading.get_ident()
+    count = 0
+
+    def before_cursor_execute(*args):
+        nonlocal count
+        if threading.get_ident() == thread_id:
+            count += 1
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    return count
+
+
+@pytest.mark.parametrize('path', ['/dashboard', '/portfolio'])
+def test_query_count_does_not_grow_with_positions(app, path):
+    with app.app_context():
+        few = seed_user(1)
+        many = seed_user(25)
+
+    counts = {}
+    for user_id in (few, many):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+        # The first request starts the background workers
+        client.get(path)
+        with app.app_context():
+            counts[user_id] = count_queries(client, path)
+
+    assert counts[few] == counts[many]
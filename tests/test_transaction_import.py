@@ -0,0 +1,169 @@
+from datetime import datetime
+
+import pytest
+
+import transaction_import
+from app import db
+from models import User, Stock, Portfolio, Transaction
+from symbols import SymbolDirectory
+from transaction_import import parse_row, find_oversold_rows, resolve_symbols, import_transactions
+
+HEADER = 'symbol,transaction_type,quantity,price,timestamp\n'
+
+
+def row(symbol='ACME', transaction_type='BUY', quantity='10', price='5', timestamp='2024-01-02'):
+    return {'symbol': symbol, 'transaction_type': transaction_type, 'quantity': quantity,
+            'price': price, 'timestamp': timestamp}
+
+
+def make_user():
+    user = User(username='importer', email='importer@example.com', password_hash='-')
+    db.session.add(user)
+    db.session.flush()
+    return user.id
+
+
+def make_stock(symbol):
+    stock = Stock(symbol=symbol, company_name=f'{symbol} Holdings', current_price=5.0)
+    db.session.add(stock)
+    db.session.flush()
+    return stock.id
+
+
+def run_import(user_id, *lines):
+    result = import_transactions(user_id, [HEADER] + [line + '\n' for line in lines])
+    db.session.commit()
+    return result
+
+
+def held(user_id, stock_id):
+    position = Portfolio.query.filter_by(user_id=user_id, stock_id=stock_id).first()
+    return position.quantity if position else 0.0
+
+
+def test_parse_row():
+    assert parse_row(row(symbol=' acme ', transaction_type='sell')) == (
+        'ACME', 'SELL', 10.0, 5.0, datetime(2024, 1, 2)
+    )
+
+
+@pytest.mark.parametrize('field, value', [
+    ('quantity', '0'), ('quantity', '-1'), ('quantity', 'nan'), ('quantity', 'inf'),
+    ('price', '-5'), ('price', 'NaN'), ('price', '-inf'), ('price', 'abc'),
+])
+def test_parse_row_rejects_bad_numbers(field, value):
+    with pytest.raises(ValueError):
+        parse_row(row(**{field: value}))
+
+
+def test_parse_row_converts_offsets_to_naive_utc():
+    assert parse_row(row(timestamp='2024-01-03T10:00:00Z'))[4] == datetime(2024, 1, 3, 10)
+    assert parse_row(row(timestamp='2024-01-03T10:00:00+02:00'))[4] == datetime(2024, 1, 3, 8)
+
+
+def test_bad_numbers_are_skipped_not_fatal(app):
+    with app.app_context():
+        user_id = make_user()
+        stock_id = make_stock('ACME')
+        result = run_import(user_id,
+                            'ACME,BUY,10,5,2024-01-02',
+                            'ACME,BUY,nan,5,2024-01-03',
+                            'ACME,BUY,2,inf,2024-01-04')
+
+        assert result.imported == 1
+        assert [line for line, _ in result.errors] == [3, 4]
+        assert held(user_id, stock_id) == 10.0
+
+
+def test_offset_timestamps_mix_with_naive_ones(app):
+    with app.app_context():
+        user_id = make_user()
+        stock_id = make_stock('ACME')
+        result = run_import(user_id,
+                            'ACME,BUY,10,5,2024-01-03T10:00:00Z',
+                            'ACME,SELL,4,6,2024-01-03T12:00:00',
+                            'ACME,SELL,6,6,2024-01-03T11:00:00+02:00')
+
+        # The last row is 09:00 UTC, before the buy, so nothing was held yet
+        assert result.imported == 2
+        assert [line for line, _ in result.errors] == [4]
+        assert held(user_id, stock_id) == 6.0
+        assert {t.timestamp for t in Transaction.query.all()} == {
+            datetime(2024, 1, 3, 10), datetime(2024, 1, 3, 12)
+        }
+
+
+def test_oversold_sell_is_skipped_with_reason(app):
+    with app.app_context():
+        user_id = make_user()
+        stock_id = make_stock('ACME')
+        result = run_import(user_id,
+                            'ACME,BUY,5,5,2024-01-02',
+                            'ACME,SELL,8,6,2024-01-03',
+                            'ACME,SELL,5,6,2024-01-04')
+
+        assert result.imported == 2
+        assert result.errors == [(3, 'cannot sell 8 ACME, only 5 held at that time')]
+        assert held(user_id, stock_id) == 0.0
+
+
+def test_imported_sells_interleave_with_existing_transactions(app):
+    with app.app_context():
+        user_id = make_user()
+        stock_id = make_stock('ACME')
+        db.session.add_all([
+            Transaction(user_id=user_id, stock_id=stock_id, transaction_type='BUY',
+                        quantity=10.0, price=5.0, timestamp=datetime(2024, 1, 1)),
+            Transaction(user_id=user_id, stock_id=stock_id, transaction_type='SELL',
+                        quantity=8.0, price=6.0, timestamp=datetime(2024, 1, 5)),
+        ])
+        db.session.flush()
+        trades = [
+            # 10 held before the existing sell, 2 after it
+            (2, 'ACME', 'SELL', 6.0, 6.0, datetime(2024, 1, 3)),
+            (3, 'ACME', 'SELL', 3.0, 6.0, datetime(2024, 1, 6)),
+            # Same timestamp as the existing sell, which counts first
+            (4, 'ACME', 'SELL', 3.0, 6.0, datetime(2024, 1, 5)),
+        ]
+
+        oversold = find_oversold_rows(user_id, trades, {'ACME': stock_id})
+
+        # The existing sell is clamped to the 4 left after line 2
+        assert oversold == {
+            3: 'cannot sell 3 ACME, only 0 held at that time',
+            4: 'cannot sell 3 ACME, only 0 held at that time',
+        }
+
+
+def test_find_oversold_rows_ignores_other_users(app):
+    with app.app_context():
+        user_id = make_user()
+        other = User(username='other', email='other@example.com', password_hash='-')
+        db.session.add(other)
+        db.session.flush()
+        stock_id = make_stock('ACME')
+        db.session.add(Transaction(user_id=other.id, stock_id=stock_id, transaction_type='BUY',
+                                   quantity=10.0, price=5.0, timestamp=datetime(2024, 1, 1)))
+        db.session.flush()
+
+        trades = [(2, 'ACME', 'SELL', 1.0, 6.0, datetime(2024, 1, 2))]
+        assert find_oversold_rows(user_id, trades, {'ACME': stock_id}) == {
+            2: 'cannot sell 1 ACME, only 0 held at that time'
+        }
+
+
+def test_resolve_symbols_names_new_stocks(app, monkeypatch):
+    directory = SymbolDirectory([('LISTED', 'Listed Industries', 'NYSE')])
+    monkeypatch.setattr(transaction_import, 'symbol_directory', directory)
+    with app.app_context():
+        existing_id = make_stock('KNOWN')
+
+        stock_ids, created = resolve_symbols(['KNOWN', 'LISTED', 'UNLISTED', 'LISTED'])
+
+        assert created == 2
+        assert stock_ids['KNOWN'] == existing_id
+        names = dict(db.session.query(Stock.symbol, Stock.company_name))
+        assert names['KNOWN'] == 'KNOWN Holdings'
+        assert names['LISTED'] == 'Listed Industries'
+        # Not in the directory: named by a full single-symbol quote, not left as the ticker
+        assert names['UNLISTED'] not in ('', 'UNLISTED')
@@ -0,0 +1,89 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app import db
+from models import User, Stock, Transaction
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_FETCH_SIZE = 1000
+
+# CSV rows written to the buffer before it is yielded to the client
+CSV_CHUNK_ROWS = 500
+
+EXPORT_COLUMNS = ['id', 'timestamp', 'symbol', 'transaction_type', 'quantity', 'price', 'value']
+ADMIN_EXPORT_COLUMNS = ['user_id', 'username'] + EXPORT_COLUMNS
+
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD query argument, returning None when it is empty"""
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def export_statement(user_id=None, start=None, end=None, symbol=None):
+    """
+    Build the SELECT for an export, in timestamp order
+    With a user_id the filters run on the (user_id, timestamp) index; for
+    all users a symbol filter runs on (stock_id, timestamp). The symbol is
+    resolved to a stock id first so the join is never used for filtering.
+    end is inclusive of the whole day.
+    """
+    columns = [
+        Transaction.id, Transaction.timestamp, Stock.symbol, Transaction.transaction_type,
+        Transaction.quantity, Transaction.price
+    ]
+    if user_id is None:
+        columns = [Transaction.user_id, User.username] + columns
+
+    statement = select(*columns).join(Stock, Transaction.stock_id == Stock.id)
+    if user_id is None:
+        statement = statement.join(User, Transaction.user_id == User.id)
+    else:
+        statement = statement.where(Transaction.user_id == user_id)
+
+    if symbol:
+        stock_ids = [stock_id for (stock_id,) in db.session.query(Stock.id).filter(Stock.symbol == symbol.upper())]
+        statement = statement.where(Transaction.stock_id.in_(stock_ids))
+    if start is not None:
+        statement = statement.where(Transaction.timestamp >= start)
+    if end is not None:
+        statement = statement.where(Transaction.timestamp < end + timedelta(days=1))
+
+    return statement.order_by(Transaction.timestamp, Transaction.id)
+
+
+def iter_transactions(statement, fetch_size=EXPORT_FETCH_SIZE):
+    """Yield export rows as dicts, fetching from a server-side cursor in batches"""
+    result = db.session.execute(statement.execution_options(stream_results=True, yield_per=fetch_size))
+    for row in result:
+        data = row._asdict()
+        data['timestamp'] = data['timestamp'].isoformat() if data['timestamp'] else None
+        data['value'] = data['quantity'] * data['price']
+        yield data
+
+
+def generate_csv(rows, columns):
+    """Yield CSV text in chunks of CSV_CHUNK_ROWS rows, starting with the header"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % CSV_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def generate_ndjson(rows):
+    """Yield one JSON object per line"""
+    for row in rows:
+        yield json.dumps(row) + '\n'
@@ -0,0 +1,227 @@
+import csv
+import logging
+import math
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+
+from app import db
+from models import Stock, Transaction
+from accounting import rebuild_user_positions
+from symbols import symbol_directory
+
+logger = logging.getLogger(__name__)
+
+# Rows per bulk INSERT statement
+IMPORT_BATCH_SIZE = 5000
+
+# Symbols per IN (...) lookup, below SQLite's bound parameter limit
+SYMBOL_CHUNK_SIZE = 500
+
+# Row errors kept for the report; further errors are only counted
+MAX_REPORTED_ERRORS = 100
+
+REQUIRED_COLUMNS = ('symbol', 'transaction_type', 'quantity', 'price', 'timestamp')
+
+
+class ImportResult:
+    """Counts and row errors from a transaction import"""
+
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.new_stocks = 0
+        self.positions = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def summary(self):
+        return (f"{self.imported} transactions imported, {self.skipped} rows skipped, "
+                f"{self.new_stocks} new stocks, {self.positions} positions held")
+
+
+def parse_row(row):
+    """Convert one CSV row to (symbol, transaction_type, quantity, price, timestamp)"""
+    symbol = (row.get('symbol') or '').strip().upper()
+    if not symbol or len(symbol) > 10:
+        raise ValueError(f'invalid symbol {symbol!r}')
+
+    transaction_type = (row.get('transaction_type') or '').strip().upper()
+    if transaction_type not in ('BUY', 'SELL'):
+        raise ValueError(f'invalid transaction type {transaction_type!r}')
+
+    quantity = float(row.get('quantity'))
+    price = float(row.get('price'))
+    # nan and inf parse as floats but cannot be stored or summed
+    if not (math.isfinite(quantity) and math.isfinite(price)) or quantity <= 0 or price <= 0:
+        raise ValueError('quantity and price must be positive numbers')
+
+    # Accepts dates (2024-01-31) and datetimes (2024-01-31T15:30:00); times
+    # with an offset are stored as naive UTC like every other timestamp
+    timestamp = datetime.fromisoformat(row.get('timestamp').strip())
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return symbol, transaction_type, quantity, price, timestamp
+
+
+def resolve_symbols(symbols):
+    """
+    Return ({symbol: stock_id}, created) for the given symbols, creating missing stocks
+    Unknown symbols are looked up with one batched quote request; symbols
+    the provider does not know are left out of the result.
+    """
+    from utils import get_stock_infos, get_stock_info
+
+    symbols = sorted(set(symbols))
+    stock_ids = {}
+    for start in range(0, len(symbols), SYMBOL_CHUNK_SIZE):
+        chunk = symbols[start:start + SYMBOL_CHUNK_SIZE]
+        stock_ids.update(db.session.query(Stock.symbol, Stock.id).filter(Stock.symbol.in_(chunk)))
+
+    missing = [symbol for symbol in symbols if symbol not in stock_ids]
+    if not missing:
+        return stock_ids, 0
+
+    # Bulk quotes carry no company names, so names come from the symbol
+    # directory, and symbols it does not list get a full single-symbol quote
+    names = {}
+    for symbol in missing:
+        entry = symbol_directory.get(symbol)
+        if entry is not None:
+            names[symbol] = entry[1]
+
+    quotes = get_stock_infos(missing)
+    unresolved = [symbol for symbol in missing if symbol not in quotes or symbol not in names]
+    if unresolved:
+        from quote_fetcher import fetch_stock_infos_concurrently
+        fetched, _ = fetch_stock_infos_concurrently(unresolved, fetch=get_stock_info)
+        for symbol, stock_info in fetched.items():
+            quotes.setdefault(symbol, stock_info)
+            if stock_info.get('company_name'):
+                names.setdefault(symbol, stock_info['company_name'])
+
+    now = datetime.utcnow()
+    new_stocks = [
+        {
+            'symbol': symbol,
+            'company_name': names.get(symbol) or quotes[symbol].get('company_name') or symbol,
+            'current_price': quotes[symbol].get('current_price'),
+            'last_updated': now
+        }
+        for symbol in missing if symbol in quotes
+    ]
+    if new_stocks:
+        db.session.execute(insert(Stock), new_stocks)
+        for start in range(0, len(new_stocks), SYMBOL_CHUNK_SIZE):
+            chunk = [stock['symbol'] for stock in new_stocks[start:start + SYMBOL_CHUNK_SIZE]]
+            stock_ids.update(db.session.query(Stock.symbol, Stock.id).filter(Stock.symbol.in_(chunk)))
+    return stock_ids, len(new_stocks)
+
+
+def find_oversold_rows(user_id, trades, stock_ids):
+    """
+    Return {line: reason} for imported SELLs larger than the position held at their time
+    Each stock's imported rows are merged with the user's existing
+    transactions in timestamp order, as positions are replayed; at equal
+    timestamps existing rows come first and imported rows keep file order.
+    A rejected SELL leaves the running quantity unchanged, matching the
+    PositionError the trade forms raise for the same sale.
+    """
+    timelines = {}
+    for index, (line, symbol, transaction_type, quantity, price, timestamp) in enumerate(trades):
+        timelines.setdefault(stock_ids[symbol], []).append((timestamp, 1, index, transaction_type, quantity, line))
+    if not any(row[3] == 'SELL' for rows in timelines.values() for row in rows):
+        return {}
+
+    existing = db.session.query(
+        Transaction.stock_id, Transaction.timestamp, Transaction.id, Transaction.transaction_type, Transaction.quantity
+    ).filter(Transaction.user_id == user_id)
+    for stock_id, timestamp, transaction_id, transaction_type, quantity in existing:
+        if stock_id in timelines:
+            timelines[stock_id].append((timestamp, 0, transaction_id, transaction_type, quantity, None))
+
+    oversold = {}
+    symbols = {stock_id: symbol for symbol, stock_id in stock_ids.items()}
+    for stock_id, timeline in timelines.items():
+        timeline.sort(key=lambda row: row[:3])
+        held = 0.0
+        for _, _, _, transaction_type, quantity, line in timeline:
+            if transaction_type == 'BUY':
+                held += quantity
+            elif line is not None and quantity > held + 1e-9:
+                oversold[line] = f'cannot sell {quantity:g} {symbols[stock_id]}, only {held:g} held at that time'
+            else:
+                # Oversells already in the log are clamped, as when positions are replayed
+                held = max(held - quantity, 0.0)
+    return oversold
+
+
+def import_transactions(user_id, lines, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Import trades for a user from CSV lines (a file object or any iterable)
+    The header must include symbol, transaction_type, quantity, price and
+    timestamp. Rows are validated as they are read, every distinct symbol is
+    resolved at once, transactions are written with bulk INSERTs and the
+    affected positions and snapshot are rebuilt once at the end. Invalid
+    rows, and SELLs of more shares than the user held at that time, are
+    skipped and reported. Does not commit.
+    """
+    from snapshots import refresh_snapshot
+
+    result = ImportResult()
+    reader = csv.DictReader(lines)
+    missing_columns = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing_columns:
+        raise ValueError(f"Missing CSV columns: {', '.join(missing_columns)}")
+
+    # Rows are kept as compact tuples until the symbols are resolved
+    trades = []
+    for row in reader:
+        try:
+            trades.append((reader.line_num,) + parse_row(row))
+        except (TypeError, ValueError, AttributeError) as e:
+            result.add_error(reader.line_num, str(e))
+
+    stock_ids, result.new_stocks = resolve_symbols(trade[1] for trade in trades)
+
+    resolved = []
+    for trade in trades:
+        if trade[1] in stock_ids:
+            resolved.append(trade)
+        else:
+            result.add_error(trade[0], f'unknown symbol {trade[1]}')
+    oversold = find_oversold_rows(user_id, resolved, stock_ids)
+
+    batch = []
+    affected = set()
+    for line, symbol, transaction_type, quantity, price, timestamp in resolved:
+        if line in oversold:
+            result.add_error(line, oversold[line])
+            continue
+        stock_id = stock_ids[symbol]
+        affected.add(stock_id)
+        batch.append({
+            'user_id': user_id,
+            'stock_id': stock_id,
+            'transaction_type': transaction_type,
+            'quantity': quantity,
+            'price': price,
+            'timestamp': timestamp
+        })
+        if len(batch) >= batch_size:
+            db.session.execute(insert(Transaction), batch)
+            result.imported += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(Transaction), batch)
+        result.imported += len(batch)
+
+    if affected:
+        result.positions = rebuild_user_positions(user_id, affected)
+        refresh_snapshot(user_id)
+    logger.info("Transaction import for user %s: %s", user_id, result.summary())
+    return result
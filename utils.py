@@ -1,94 +1,183 @@
-import yfinance as yf
 import logging
 from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 from models import Stock, Portfolio
 from app import db
+from providers import get_provider
+import quote_cache
+from price_history import record_prices
+from shared_cache import get_shared_cache
+from metrics import timed_quote_fetch
+from analytics import CHART_COLORS
 
-def get_stock_info(symbol):
+logger = logging.getLogger(__name__)
+
+def get_stock_info(symbol, use_cache=True):
     """
-    Get stock information from Yahoo Finance API
-    Returns a dict with company name and current price
+    Get stock information from the active quote provider
+    Returns a dict with company name and current price. Lookups go through
+    the in-process quote cache unless use_cache is False.
     """
     if not symbol:
-        logging.error("Empty symbol provided to get_stock_info")
-        return None
-        
-    try:
-        print(f"Fetching stock info for {symbol}")
-        stock = yf.Ticker(symbol)
-        
-        # Try to get price information
-        try:
-            # First try to get price directly from ticker
-            current_price = stock.info.get('regularMarketPrice')
-            if not current_price or current_price == 0:
-                current_price = stock.info.get('currentPrice')
-            
-            # If that fails, try getting recent history
-            if not current_price or current_price == 0:
-                hist = stock.history(period="1d")
-                if not hist.empty and 'Close' in hist.columns:
-                    current_price = float(hist['Close'].iloc[-1])
-                    
-            # Default fallback
-            if not current_price or current_price == 0:
-                print(f"Warning: Could not get price for {symbol}, using default")
-                current_price = 0.0
-                
-            # Get company name
-            company_name = stock.info.get('longName') 
-            if not company_name:
-                company_name = stock.info.get('shortName', symbol.upper())
-            
-            print(f"Successfully retrieved {symbol} data: {company_name}, ${current_price}")
-            
-            return {
-                'symbol': symbol.upper(),
-                'company_name': company_name,
-                'current_price': float(current_price)
-            }
-        except Exception as e:
-            logging.error(f"Error getting price for {symbol}: {str(e)}")
-            return {
-                'symbol': symbol.upper(),
-                'company_name': symbol.upper() + ' Inc.',
-                'current_price': 0.0
-            }
-            
-    except Exception as e:
-        logging.error(f"Error fetching stock info for {symbol}: {str(e)}")
+        logger.error("Empty symbol provided to get_stock_info")
         return None
+    
+    symbol = symbol.upper()
+    if not use_cache:
+        return _fetch_upstream_quote(symbol)
+    
+    return quote_cache.get_cache().get_or_fetch(symbol, _fetch_shared_quote)
+
+def _fetch_upstream_quote(symbol):
+    """Ask the quote provider for one symbol, recording latency and failures"""
+    return timed_quote_fetch(
+        'quote', lambda: get_provider().get_quote(symbol), 1,
+        lambda stock_info: 1 if stock_info and stock_info.get('current_price') else 0
+    )
+
+def _fetch_shared_quote(symbol):
+    """Read a quote from the shared cross-worker cache, going upstream on a miss"""
+    shared = get_shared_cache()
+    if shared is not None:
+        stock_info = shared.get(symbol)
+        if stock_info:
+            return stock_info
+    
+    stock_info = _fetch_upstream_quote(symbol)
+    if shared is not None and stock_info and stock_info.get('current_price'):
+        shared.put(stock_info)
+    return stock_info
+
+def get_stock_infos(symbols):
+    """
+    Get current prices for many symbols from the active quote provider
+    Returns a dict keyed by upper-cased symbol; symbols without a usable
+    price are left out. Bulk quotes may not include company names, use
+    get_stock_info for a full single-symbol lookup.
+    """
+    symbols = sorted({symbol.upper() for symbol in symbols if symbol})
+    if not symbols:
+        return {}
+    
+    return timed_quote_fetch('quotes', lambda: get_provider().get_quotes(symbols), len(symbols), len)
 
-def update_stock_data():
-    """Update all stock prices in the database"""
+def update_stock_data(max_age=timedelta(hours=1)):
+    """Update all stock prices in the database that are older than max_age"""
     stocks = Stock.query.all()
-    update_count = 0
-    
-    for stock in stocks:
-        # Only update stocks that haven't been updated in the last hour
-        if not stock.last_updated or (datetime.utcnow() - stock.last_updated) > timedelta(hours=1):
-            stock_info = get_stock_info(stock.symbol)
-            if stock_info and stock_info.get('current_price'):
-                stock.current_price = stock_info.get('current_price')
-                stock.last_updated = datetime.utcnow()
-                update_count += 1
-            
+    updated_prices = {}
+    
+    # Only update stocks that haven't been updated within max_age
+    now = datetime.utcnow()
+    stale_stocks = [
+        stock for stock in stocks
+        if not stock.last_updated or (now - stock.last_updated) > max_age
+    ]
+    if not stale_stocks:
+        return 0
+    
+    # Prices another worker already fetched are taken from the shared cache
+    # when they are newer than what this stock has stored
+    shared = get_shared_cache()
+    if shared is not None:
+        shared_quotes = shared.get_many([stock.symbol for stock in stale_stocks], max_age)
+        remaining = []
+        for stock in stale_stocks:
+            stock_info = shared_quotes.get(stock.symbol.upper())
+            if stock_info and (not stock.last_updated or stock_info['last_updated'] > stock.last_updated):
+                stock.current_price = stock_info['current_price']
+                stock.last_updated = stock_info['last_updated']
+                updated_prices[stock.id] = stock.current_price
+            else:
+                remaining.append(stock)
+        stale_stocks = remaining
+    
+    quotes = get_stock_infos(stock.symbol for stock in stale_stocks)
+    
+    # Fall back to concurrent single-symbol lookups for anything the bulk
+    # download did not return
+    missing = [stock.symbol for stock in stale_stocks if stock.symbol.upper() not in quotes]
+    if missing:
+        from quote_fetcher import fetch_stock_infos_concurrently
+        fetched, _ = fetch_stock_infos_concurrently(
+            missing, fetch=lambda symbol: get_stock_info(symbol, use_cache=False)
+        )
+        quotes.update(fetched)
+        for symbol, stock_info in fetched.items():
+            quote_cache.get_cache().put(symbol, stock_info)
+    
+    if shared is not None and quotes:
+        shared.put_many(quotes, now)
+    
+    for stock in stale_stocks:
+        stock_info = quotes.get(stock.symbol.upper())
+        if stock_info and stock_info.get('current_price'):
+            stock.current_price = stock_info.get('current_price')
+            stock.last_updated = now
+            updated_prices[stock.id] = stock.current_price
+    
+    update_count = len(updated_prices)
     if update_count > 0:
+        # Keep today's daily bar in the local price history current
+        record_prices(updated_prices, now)
+        # Holders of repriced stocks get fresh snapshots in the same commit
+        from snapshots import refresh_snapshots_for_stocks
+        refresh_snapshots_for_stocks(updated_prices)
         try:
             db.session.commit()
-            logging.info(f"Updated prices for {update_count} stocks")
+            logger.info("Updated prices for %s stocks", update_count, extra={'updated': update_count})
         except Exception as e:
             db.session.rollback()
-            logging.error(f"Error updating stock prices: {str(e)}")
+            logger.error("Error updating stock prices: %s", e)
+    
+    return update_count
+
+def get_portfolio_positions(user_id):
+    """Load a user's portfolio positions together with their stocks in one query"""
+    return Portfolio.query.options(joinedload(Portfolio.stock)).filter_by(user_id=user_id).all()
+
+def _build_totals(total_current_value, total_investment):
+    """Derive profit/loss metrics from summed value and investment"""
+    total_current_value = float(total_current_value or 0.0)
+    total_investment = float(total_investment or 0.0)
+    total_profit_loss = float(total_current_value - total_investment)
+    
+    if total_investment > 0:
+        profit_loss_percentage = float((total_profit_loss / total_investment) * 100)
+    else:
+        profit_loss_percentage = 0.0
+    
+    return {
+        'total_current_value': total_current_value,
+        'total_investment': total_investment,
+        'total_profit_loss': total_profit_loss,
+        'profit_loss_percentage': profit_loss_percentage
+    }
 
-def calculate_portfolio_totals(user_id):
-    """Calculate total portfolio value and metrics for a user"""
-    portfolios = Portfolio.query.filter_by(user_id=user_id).all()
+def _portfolio_sums_query():
+    """Select summed current value and investment per user, joining portfolio and stock"""
+    # SUM skips rows where the price or average is NULL, matching the
+    # per-position properties which count those as zero
+    return db.session.query(
+        Portfolio.user_id,
+        func.coalesce(func.sum(Portfolio.quantity * Stock.current_price), 0.0),
+        func.coalesce(func.sum(Portfolio.quantity * Portfolio.average_buy_price), 0.0)
+    ).join(Stock, Portfolio.stock_id == Stock.id).group_by(Portfolio.user_id)
+
+def calculate_portfolio_totals(user_id, positions=None):
+    """Calculate total portfolio value and metrics for a user
+    Totals are aggregated in a single SQL query unless already loaded
+    positions are passed in, in which case they are summed directly"""
+    if positions is None:
+        row = _portfolio_sums_query().filter(Portfolio.user_id == user_id).first()
+        if row is None:
+            return _build_totals(0.0, 0.0)
+        return _build_totals(row[1], row[2])
     
     total_current_value = 0.0
     total_investment = 0.0
     
-    for position in portfolios:
+    for position in positions:
         # Calculate values directly instead of using properties
         current_value = position.quantity * position.stock.current_price if position.stock.current_price else 0
         investment = position.quantity * position.average_buy_price if position.average_buy_price else 0
@@ -96,27 +185,39 @@ def calculate_portfolio_totals(user_id):
         total_current_value += float(current_value)
         total_investment += float(investment)
     
-    total_profit_loss = float(total_current_value - total_investment)
-    
-    if total_investment > 0:
-        profit_loss_percentage = float((total_profit_loss / total_investment) * 100)
-    else:
-        profit_loss_percentage = 0.0
+    return _build_totals(total_current_value, total_investment)
+
+def calculate_portfolio_totals_for_users(user_ids=None):
+    """Calculate portfolio totals for many users (all users by default) in one query
+    Returns a dict keyed by user id; users without positions get zero totals"""
+    query = _portfolio_sums_query()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        query = query.filter(Portfolio.user_id.in_(user_ids))
     
+    totals = {user_id: _build_totals(value, investment) for user_id, value, investment in query.all()}
+    for user_id in user_ids or []:
+        totals.setdefault(user_id, _build_totals(0.0, 0.0))
+    return totals
+
+def get_stock_holdings():
+    """Total quantity held and current value per stock id across all users, in one query"""
+    rows = db.session.query(
+        Portfolio.stock_id,
+        func.sum(Portfolio.quantity),
+        func.coalesce(func.sum(Portfolio.quantity * Stock.current_price), 0.0)
+    ).join(Stock, Portfolio.stock_id == Stock.id).group_by(Portfolio.stock_id).all()
     return {
-        'total_current_value': total_current_value,
-        'total_investment': total_investment,
-        'total_profit_loss': total_profit_loss,
-        'profit_loss_percentage': profit_loss_percentage
+        stock_id: {'quantity': quantity, 'current_value': current_value}
+        for stock_id, quantity, current_value in rows
     }
 
-def get_portfolio_data_for_chart(user_id):
+def get_portfolio_data_for_chart(user_id, positions=None):
     """Get portfolio data formatted for chart visualization"""
     # Get portfolios with proper joining to ensure stock data is available
-    portfolios = Portfolio.query.filter_by(user_id=user_id).all()
+    portfolios = positions if positions is not None else get_portfolio_positions(user_id)
     
-    # Debug information
-    print(f"Found {len(portfolios)} portfolio positions for user {user_id}")
+    logger.debug("Found %s portfolio positions for user %s", len(portfolios), user_id)
     
     # Prepare data structures with primitives only
     chart_data = {
@@ -125,16 +226,9 @@ def get_portfolio_data_for_chart(user_id):
         'colors': []
     }
     
-    # Color list (pure strings)
-    colors = [
-        '#4dc9f6', '#f67019', '#f53794', '#537bc4', '#acc236',
-        '#166a8f', '#00a950', '#58595b', '#8549ba', '#8b0000', 
-        '#3cb44b', '#ffe119', '#4363d8', '#f58231', '#911eb4'
-    ]
-    
     # Check if portfolio is empty
     if not portfolios:
-        print("Portfolio is empty, returning empty chart data")
+        logger.debug("Portfolio is empty, returning empty chart data")
         return chart_data
     
     # Process each portfolio position
@@ -142,16 +236,16 @@ def get_portfolio_data_for_chart(user_id):
         try:
             # Skip invalid data
             if not position.quantity or position.quantity <= 0:
-                print(f"Skipping position with invalid quantity: {position.quantity}")
+                logger.debug("Skipping position with invalid quantity: %s", position.quantity)
                 continue
             
             # Ensure stock exists and has a price
             if not position.stock:
-                print(f"Skipping position with missing stock data")
+                logger.warning("Skipping position %s with missing stock data", position.id)
                 continue
                 
             if not position.stock.current_price or position.stock.current_price <= 0:
-                print(f"Stock {position.stock.symbol} has invalid price: {position.stock.current_price}")
+                logger.info("Stock %s has invalid price: %s", position.stock.symbol, position.stock.current_price)
                 # Try to update the stock price
                 stock_info = get_stock_info(position.stock.symbol)
                 if stock_info and stock_info.get('current_price', 0) > 0:
@@ -159,12 +253,12 @@ def get_portfolio_data_for_chart(user_id):
                     position.stock.last_updated = datetime.utcnow()
                     try:
                         db.session.commit()
-                        print(f"Updated price for {position.stock.symbol} to {position.stock.current_price}")
+                        logger.info("Updated price for %s to %s", position.stock.symbol, position.stock.current_price)
                     except Exception as e:
                         db.session.rollback()
-                        print(f"Failed to update price: {e}")
+                        logger.error("Failed to update price for %s: %s", position.stock.symbol, e)
                 else:
-                    print(f"Could not get valid price for {position.stock.symbol}")
+                    logger.warning("Could not get valid price for %s", position.stock.symbol)
                     continue
             
             # Compute value as a primitive float
@@ -174,46 +268,30 @@ def get_portfolio_data_for_chart(user_id):
             
             # Only use primitive strings and floats
             symbol = str(position.stock.symbol)
-            color_index = i % len(colors)
+            color_index = i % len(CHART_COLORS)
             
             # Add primitives to the result
             chart_data['labels'].append(symbol)
             chart_data['values'].append(value)
-            chart_data['colors'].append(colors[color_index])
+            chart_data['colors'].append(CHART_COLORS[color_index])
             
-            print(f"Added position to chart: {symbol}, value: {value}")
-            
-        except Exception as e:
-            print(f"Error processing portfolio position: {e}")
+        except Exception:
+            logger.exception("Error processing portfolio position")
             continue
     
-    print(f"Final chart data: {len(chart_data['labels'])} stocks, values: {chart_data['values']}")
+    logger.debug("Chart data for user %s: %s stocks", user_id, len(chart_data['labels']))
     return chart_data
 
 def update_average_buy_price(portfolio):
-    """Recalculate the average buy price for a portfolio position"""
-    from models import Transaction
+    """Recalculate the average buy price for a portfolio position
+    Rebuilds the position from its full transaction history, so use it for
+    repairs only; trades update positions incrementally via accounting.record_trade"""
+    from accounting import rebuild_position
     
-    buy_transactions = Transaction.query.filter_by(
-        user_id=portfolio.user_id,
-        stock_id=portfolio.stock_id,
-        transaction_type='BUY'
-    ).all()
-    
-    total_shares = 0
-    total_cost = 0
-    
-    for transaction in buy_transactions:
-        total_cost += transaction.price * transaction.quantity
-        total_shares += transaction.quantity
-    
-    if total_shares > 0:
-        portfolio.average_buy_price = total_cost / total_shares
-    else:
-        portfolio.average_buy_price = 0
+    rebuild_position(portfolio.user_id, portfolio.stock_id)
     
     try:
         db.session.commit()
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error updating average buy price: {str(e)}")
+        logger.error("Error updating average buy price: %s", e)